@@ -31,14 +31,53 @@ BosonNLP HTTP API 封装库（SDK）。
 """
 
 from __future__ import absolute_import, division, print_function, unicode_literals
+import sys
 import logging
 
 
 __VERSION__ = '0.11.1'
 
 
-from .client import BosonNLP, ClusterTask, CommentsTask
-from .exceptions import HTTPError, TaskNotFoundError, TaskError, TimeoutError
+# Public name -> submodule defining it.  The submodules pull in `requests`, so
+# on Python 3.7+ they are only imported when one of these names is first used.
+_LAZY_ATTRIBUTES = {
+    'BosonNLP': 'client',
+    'ClusterTask': 'client',
+    'CommentsTask': 'client',
+    'CircuitBreaker': 'client',
+    'Hedger': 'client',
+    'Payload': 'client',
+    'HTTPError': 'exceptions',
+    'TaskNotFoundError': 'exceptions',
+    'TaskError': 'exceptions',
+    'TimeoutError': 'exceptions',
+    'CircuitOpenError': 'exceptions',
+}
+
+# Submodules that were bound as package attributes when the package imported
+# them eagerly, so `bosonnlp.exceptions.HTTPError` keeps working.
+_SUBMODULES = ('client', 'exceptions', 'bulk', 'sinks', 'pipeline', 'columnar', 'registry', 'replay')
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+if sys.version_info >= (3, 7):
+    import importlib
+
+    def __getattr__(name):
+        if name in _SUBMODULES:
+            return importlib.import_module('.' + name, __name__)
+        module = _LAZY_ATTRIBUTES.get(name)
+        if module is None:
+            raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
+        value = getattr(importlib.import_module('.' + module, __name__), name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(_LAZY_ATTRIBUTES) | set(_SUBMODULES))
+else:
+    from .client import BosonNLP, ClusterTask, CommentsTask, CircuitBreaker, Hedger, Payload
+    from .exceptions import HTTPError, TaskNotFoundError, TaskError, TimeoutError, CircuitOpenError
 
 # Set default logging handler to avoid "No handler found" warnings.
 try:  # Python 2.7+
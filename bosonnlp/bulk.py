@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""多进程批量调用。
+
+处理大量文本时，JSON 编解码和 gzip 压缩会使单个 Python 进程受限于 GIL。
+:py:func:`run` 将输入按顺序切分成块，分发到多个进程中处理，每个进程使用独立的
+:py:class:`~bosonnlp.BosonNLP` 实例，并按输入顺序流式返回结果。
+
+    >>> import os
+    >>> from bosonnlp import bulk
+    >>> for result in bulk.run('tag', texts, os.environ['BOSON_API_TOKEN'], processes=4):
+    ...     print(result['word'])
+
+也可以通过 `sink` 参数把结果直接写入 :py:mod:`bosonnlp.sinks` 中的输出，
+内存占用不会随文本数量增长。
+
+    >>> from bosonnlp.sinks import JSONLSink
+    >>> with JSONLSink('tags.jsonl') as sink:
+    ...     bulk.run('tag', texts, os.environ['BOSON_API_TOKEN'], sink=sink)
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import multiprocessing
+from itertools import islice
+from functools import partial
+
+from .client import BosonNLP, _imap_bounded, _imap_bounded_unordered
+
+
+BATCH_ENDPOINTS = ('sentiment', 'classify', 'depparser', 'ner', 'tag')
+
+# The per-process client, created by `_init_worker` in each worker process.
+_nlp = None
+
+
+def _init_worker(token, nlp_options):
+    global _nlp
+    _nlp = BosonNLP(token, **nlp_options)
+
+
+def _process_chunk(endpoint, kwargs, chunk):
+    return getattr(_nlp, endpoint)(chunk, **kwargs)
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run(endpoint, iterable, token, processes=None, chunk_size=100, max_pending=None, nlp_options=None,
+        sink=None, ordered=True, **kwargs):
+    """使用进程池批量调用 `endpoint` 接口。
+
+    :param string endpoint: 支持批量调用的接口名，可以是 ``sentiment``、``classify``、
+        ``depparser``、``ner`` 或 ``tag``。
+
+    :param iterable: 需要处理的文本，可以是任意可迭代对象，会被按需读取。
+
+    :param string token: 用于 API 鉴权的 API Token。
+
+    :param int processes: 进程数，默认为 CPU 核数。
+
+    :param int chunk_size: 每次请求发送的文本数，默认为 100。
+
+    :param int max_pending: 最多同时提交的块数，默认为进程数的两倍。
+
+    :param dict nlp_options: 创建 :py:class:`~bosonnlp.BosonNLP` 实例的其他参数。
+
+    :param sink: 默认为 :py:class:`None`。如果指定，每批结果一返回就写入该
+        :py:class:`~bosonnlp.sinks.Sink`，不在内存中保留。
+
+    :param bool ordered: 默认为 True，按输入顺序产生结果。为 False 时每批结果一完成
+        就产生，迭代器产生 ``(序号, 结果)`` 对。
+
+    其他关键字参数会原样传给 `endpoint` 方法。
+
+    :returns: 按输入顺序逐个产生结果的迭代器；如果指定了 `sink`，则处理完所有文本后
+        返回写入的结果数。
+
+    :raises: :py:exc:`~bosonnlp.HTTPError` 如果 API 请求发生错误。
+    """
+    if endpoint not in BATCH_ENDPOINTS:
+        raise ValueError('{0!r} is not a batch endpoint, expected one of {1}'.format(
+            endpoint, ', '.join(BATCH_ENDPOINTS)))
+    processes = processes or multiprocessing.cpu_count()
+    max_pending = max_pending or 2 * processes
+    results = _run(endpoint, iterable, token, processes, chunk_size, max_pending, nlp_options or {}, ordered,
+                   kwargs)
+    if sink is None:
+        return results
+    if ordered:
+        results = enumerate(results)
+    count = 0
+    for index, result in results:
+        sink.write(index, result)
+        count += 1
+    return count
+
+
+def _run(endpoint, iterable, token, processes, chunk_size, max_pending, nlp_options, ordered, kwargs):
+    pool = multiprocessing.Pool(processes, _init_worker, (token, nlp_options))
+    try:
+        func = partial(_process_chunk, endpoint, kwargs)
+        chunks = _chunks(iterable, chunk_size)
+        if ordered:
+            for results in _imap_bounded(pool, func, chunks, max_pending):
+                for result in results:
+                    yield result
+        else:
+            for i, results in _imap_bounded_unordered(pool, func, chunks, max_pending):
+                for j, result in enumerate(results):
+                    yield i * chunk_size + j, result
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
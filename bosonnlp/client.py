@@ -1,24 +1,47 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import re
 import sys
-import gzip
 import json
 import logging
-import uuid
 import time
 import datetime
+import threading
+from multiprocessing.pool import ThreadPool
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
 from io import BytesIO
 from functools import partial
+from contextlib import contextmanager
+from collections import deque, namedtuple, Counter, OrderedDict
 import requests
 
 from . import __VERSION__
-from .exceptions import HTTPError, TaskNotFoundError, TaskError, TimeoutError
+from .exceptions import HTTPError, TaskNotFoundError, TaskError, TimeoutError, CircuitOpenError
 
 
 PY2 = sys.version_info[0] == 2
 DEFAULT_BOSONNLP_URL = 'https://api.bosonnlp.com'
 DEFAULT_TIMEOUT = 30 * 60
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_BATCH_BYTES = 512 * 1024
+DEFAULT_WORKERS = 8
+DEFAULT_CACHE_SIZE = 1024
+# Seconds to wait for clearing a task when leaving its `with` block.
+CLEAR_ON_EXIT_TIMEOUT = 10
+
+# Endpoints and default query parameters of the batch analysis APIs, as used
+# by the methods of the same names.
+_BATCH_APIS = {
+    'sentiment': ('/sentiment/analysis?general', None),
+    'classify': ('/classify/analysis', None),
+    'depparser': ('/depparser/analysis', None),
+    'ner': ('/ner/analysis', {'space_mode': '3'}),
+    'tag': ('/tag/analysis', {'space_mode': 0, 'oov_level': 3, 't2s': 0, 'special_char_conv': 0}),
+}
 
 
 if PY2:
@@ -31,12 +54,57 @@ else:
 
 logger = logging.getLogger(__name__)
 
+_monotonic = getattr(time, 'monotonic', time.time)
+
+# The deadline (a `_monotonic` time) of the calls made by the current thread.
+_deadline_local = threading.local()
+
+# Marks the threads of `_thread_imap` and `_WorkerPool` pools, which always
+# get a session of their own.
+_pool_local = threading.local()
+
+
+def _get_deadline():
+    return getattr(_deadline_local, 'deadline', None)
+
+
+def _remaining():
+    deadline = _get_deadline()
+    return None if deadline is None else deadline - _monotonic()
+
+
+@contextmanager
+def _deadline_scope(deadline):
+    previous = _get_deadline()
+    _deadline_local.deadline = deadline
+    try:
+        yield
+    finally:
+        _deadline_local.deadline = previous
+
+
+def _call_with_deadline(deadline, func, *args):
+    with _deadline_scope(deadline):
+        return func(*args)
+
+
+def _cap_timeout(timeout, remaining):
+    """Cap a requests ``timeout`` (a number, a (connect, read) tuple or None) at ``remaining``."""
+    if isinstance(timeout, tuple):
+        return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+# gzip, hashlib and uuid are imported where they are needed, so that importing
+# the client stays cheap for short-lived processes.
 
 def _generate_id():
+    import uuid
     return str(uuid.uuid4())
 
 
 def _gzip_compress(buf):
+    import gzip
     zbuf = BytesIO()
     with gzip.GzipFile(mode='wb', fileobj=zbuf, compresslevel=9) as zfile:
         zfile.write(buf)
@@ -46,6 +114,628 @@ def _gzip_compress(buf):
 _json_dumps = partial(json.dumps, ensure_ascii=False, sort_keys=True)
 
 
+def _imap_bounded(pool, func, iterable, max_pending):
+    """Like ``pool.imap(func, iterable)``, but keeps at most ``max_pending``
+    items submitted and not yet consumed, so a huge (or endless) ``iterable``
+    is never read ahead into memory.  Results are yielded in input order.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _imap_bounded_unordered(pool, func, iterable, max_pending):
+    """Like :py:func:`_imap_bounded`, but yield ``(index, result)`` pairs in
+    completion order, as soon as each item is done.
+    """
+    done = queue.Queue()
+    pending = 0
+    for index, item in enumerate(iterable):
+        pool.apply_async(partial(_capture, func), (item,), callback=partial(_put_indexed, done, index))
+        pending += 1
+        if pending >= max_pending:
+            yield _get_indexed(done)
+            pending -= 1
+    while pending:
+        yield _get_indexed(done)
+        pending -= 1
+
+
+def _put_indexed(done, index, result):
+    done.put((index, result))
+
+
+def _get_indexed(done):
+    index, result = done.get()
+    if isinstance(result, Exception):
+        raise result
+    return index, result
+
+
+def _encode_json(data):
+    body = _json_dumps(data)
+    if isinstance(body, text_type):
+        body = body.encode('utf-8')
+    return body
+
+
+# A request body ready to be sent: the (possibly compressed) bytes and the
+# Content-Type/Content-Encoding headers describing them.
+_EncodedBody = namedtuple('_EncodedBody', 'data headers')
+
+
+class Payload(object):
+    """预先编码好的批量请求体，原样发送，不再编码或压缩。
+
+    可以传给 :py:meth:`~bosonnlp.BosonNLP.sentiment`、:py:meth:`~bosonnlp.BosonNLP.classify`、
+    :py:meth:`~bosonnlp.BosonNLP.depparser`、:py:meth:`~bosonnlp.BosonNLP.ner`、
+    :py:meth:`~bosonnlp.BosonNLP.tag` 和 :py:meth:`~bosonnlp.BosonNLP.analyze`
+    代替文本序列。直接传入 :py:class:`bytearray`、:py:class:`memoryview`
+    （Python 3 中还有 :py:class:`bytes`）等同于传入 ``Payload(data)``。
+
+    预先编码的请求体不会被拆分、去重或分段，文本数需要满足接口单次请求的限制。
+
+    :param data: UTF-8 编码的 JSON 文本数组。
+    :type data: bytes, bytearray or memoryview
+
+    :param bool gzipped: 默认为 False，`data` 是否已经经过 gzip 压缩。
+
+    >>> import os
+    >>> nlp = BosonNLP(os.environ['BOSON_API_TOKEN'])
+    >>> nlp.classify(Payload(message.value, gzipped=True))
+    [5, 2]
+    """
+
+    def __init__(self, data, gzipped=False):
+        self.data = data
+        self.gzipped = gzipped
+
+    def _encoded(self):
+        headers = {'Content-Type': 'application/json'}
+        if self.gzipped:
+            headers['Content-Encoding'] = 'gzip'
+        return _EncodedBody(self.data, headers)
+
+
+# On Python 2 `str` may be a text, so only unambiguous binary types count as payloads.
+_PAYLOAD_TYPES = (bytearray, memoryview) if PY2 else (bytes, bytearray, memoryview)
+
+
+def _as_payload(contents):
+    if isinstance(contents, Payload):
+        return contents
+    if isinstance(contents, _PAYLOAD_TYPES):
+        return Payload(contents)
+    return None
+
+
+def _iter_chunks(contents, max_items, max_bytes):
+    """Split ``contents`` into chunks of at most ``max_items`` items whose JSON
+    encoding is at most ``max_bytes`` bytes (a single larger item gets a chunk of
+    its own).  Yield ``(chunk, body)`` pairs, where ``body`` is the encoded chunk,
+    built while measuring so no item is encoded twice.
+    """
+    chunk, parts, size = [], [], 2
+    for item in contents:
+        part = _encode_json(item)
+        if chunk and (len(chunk) >= max_items or size + len(part) + 1 > max_bytes):
+            yield chunk, b'[' + b','.join(parts) + b']'
+            chunk, parts, size = [], [], 2
+        chunk.append(item)
+        parts.append(part)
+        size += len(part) + 1
+    if chunk:
+        yield chunk, b'[' + b','.join(parts) + b']'
+
+
+def _write_to_sink(sink, results, start=0):
+    """Write ``results`` to ``sink`` numbered from ``start``; return how many."""
+    count = 0
+    for count, result in enumerate(results, 1):
+        sink.write(start + count - 1, result)
+    return count
+
+
+_SENTENCE_RE = re.compile(r'[^。！？!?；;\n]*[。！？!?；;\n]+[”’」』）)]*|[^。！？!?；;\n]+')
+
+
+def _split_text(text, max_length):
+    """Split ``text`` at sentence boundaries into pieces of at most ``max_length``
+    characters; a sentence longer than that is cut hard.  The pieces always
+    concatenate back to ``text``.
+    """
+    if len(text) <= max_length:
+        return [text]
+    pieces = []
+    current = ''
+    for sentence in _SENTENCE_RE.findall(text):
+        if current and len(current) + len(sentence) > max_length:
+            pieces.append(current)
+            current = ''
+        while len(sentence) > max_length:
+            pieces.append(sentence[:max_length])
+            sentence = sentence[max_length:]
+        current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _merge_words(pieces, results):
+    """Merge the tag/ner/depparser results of the pieces of one document."""
+    merged = dict((key, []) for key in results[0])
+    for result in results:
+        offset = len(merged['word'])
+        for key, value in result.items():
+            if key == 'entity':
+                value = [[e[0] + offset, e[1] + offset] + e[2:] for e in value]
+            elif key == 'head':
+                value = [head + offset if head >= 0 else head for head in value]
+            merged[key].extend(value)
+    return merged
+
+
+def _projection(fields):
+    """Return a JSON ``object_pairs_hook`` that keeps only the keys in ``fields``,
+    so the dropped values are released as soon as each object is decoded.
+    """
+    if fields is None:
+        return None
+    fields = frozenset(fields)
+    return lambda pairs: dict((key, value) for key, value in pairs if key in fields)
+
+
+def _sentiment_merger(weighting):
+    if weighting == 'length':
+        weighting = len
+    elif weighting == 'uniform':
+        weighting = lambda piece: 1
+    elif not callable(weighting):
+        raise ValueError('weighting must be \'length\', \'uniform\' or a callable, got {0!r}'.format(weighting))
+
+    def merge(pieces, results):
+        weights = [weighting(piece) for piece in pieces]
+        total = sum(weights)
+        if not total:
+            weights, total = [1] * len(pieces), len(pieces)
+        return [sum(w * result[i] for w, result in zip(weights, results)) / total
+                for i in range(len(results[0]))]
+    return merge
+
+
+def _dedup(contents):
+    """Return ``(unique, positions)`` such that ``unique[positions[i]] == contents[i]``."""
+    index = {}
+    unique = []
+    positions = []
+    for text in contents:
+        pos = index.get(text)
+        if pos is None:
+            pos = index[text] = len(unique)
+            unique.append(text)
+        positions.append(pos)
+    return unique, positions
+
+
+def _simhash(text, ngram=3):
+    """Return the 64-bit SimHash fingerprint of the character n-grams of ``text``."""
+    import hashlib
+    grams = Counter(text[i:i + ngram] for i in range(max(len(text) - ngram + 1, 1)))
+    weights = [0] * 64
+    for gram, count in grams.items():
+        h = int(hashlib.md5(gram.encode('utf-8')).hexdigest()[:16], 16)
+        for i in range(64):
+            weights[i] += count if h >> i & 1 else -count
+    return sum(1 << i for i in range(64) if weights[i] > 0)
+
+
+class _SimHashIndex(object):
+    """Find fingerprints within ``max_distance`` bits of each other.
+
+    The 64 bits are split into ``max_distance + 1`` bands; by the pigeonhole
+    principle two fingerprints that close must agree on at least one band, so
+    only the fingerprints sharing a band need to be compared.
+    """
+
+    def __init__(self, max_distance):
+        if not 0 <= max_distance < 64:
+            raise ValueError('max_distance must be between 0 and 63, got {0!r}'.format(max_distance))
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        width = 64 // bands
+        self._bands = [(i * width, width if i < bands - 1 else 64 - i * width) for i in range(bands)]
+        self._buckets = {}
+
+    def _keys(self, fingerprint):
+        for i, (start, width) in enumerate(self._bands):
+            yield i, fingerprint >> start & ((1 << width) - 1)
+
+    def find(self, fingerprint):
+        for key in self._keys(fingerprint):
+            for other, value in self._buckets.get(key, ()):
+                if bin(fingerprint ^ other).count('1') <= self.max_distance:
+                    return value
+        return None
+
+    def add(self, fingerprint, value):
+        for key in self._keys(fingerprint):
+            self._buckets.setdefault(key, []).append((fingerprint, value))
+
+
+def _capture(func, item):
+    try:
+        return func(item)
+    except Exception as e:
+        return e
+
+
+def _init_pool_thread():
+    _pool_local.active = True
+
+
+def _thread_imap(func, iterable, workers):
+    """Yield ``func(item)`` for each item of ``iterable`` in order, computed on
+    up to ``workers`` threads.  An exception raised for an item is yielded in
+    its place instead of aborting the rest.
+    """
+    # Worker threads run under the deadline of the calling thread.
+    func = partial(_call_with_deadline, _get_deadline(), func)
+    pool = ThreadPool(workers, _init_pool_thread)
+    try:
+        for result in _imap_bounded(pool, partial(_capture, func), iterable, 2 * workers):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class _LRUCache(object):
+    """A thread-safe LRU mapping whose entries optionally expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return default
+            value, expires = item
+            if expires is not None and expires < time.time():
+                return default
+            self._data[key] = item
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _cached_top_k(cache, key, top_k, fetch):
+    """Return ``fetch(top_k)`` through ``cache``, answering a request for fewer
+    results from a cached larger ``top_k`` result by slicing it.
+    """
+    cached = cache.get(key)
+    if cached is not None:
+        cached_top_k, result = cached
+        # A result shorter than what was asked for is already complete.
+        if top_k <= cached_top_k or len(result) < cached_top_k:
+            return result[:top_k]
+    result = fetch(top_k)
+    cache.set(key, (top_k, result))
+    return result
+
+
+def _endpoint_key(path):
+    """'/cluster/push/<task_id>' -> '/cluster/push', '/sentiment/analysis?food' -> '/sentiment/analysis'."""
+    return '/' + '/'.join(path.split('?', 1)[0].strip('/').split('/')[:2])
+
+
+class CircuitBreaker(object):
+    """按接口熔断的断路器。
+
+    某个接口连续失败 `failure_threshold` 次后进入打开状态，之后 `reset_timeout` 秒内
+    对该接口的请求不会发送，而是立即抛出 :py:exc:`~bosonnlp.CircuitOpenError`。
+    之后进入半开状态，放行一个试探请求：成功则恢复，失败则再次打开。
+
+    连接错误、超时、429 和 5xx 响应，以及耗时超过 `slow_call_duration` 的请求计为失败。
+    使用多个后端时每个后端分别熔断，429 不计为失败，由负载均衡绕开用完配额的后端。
+
+    :param int failure_threshold: 连续失败多少次后熔断，默认为 5。
+
+    :param float reset_timeout: 熔断持续的秒数，默认为 30 秒。
+
+    :param float slow_call_duration: 默认为 :py:class:`None`。耗时超过该秒数的请求即使
+        成功也计为失败。
+
+    >>> import os
+    >>> breaker = CircuitBreaker(failure_threshold=3, slow_call_duration=10)
+    >>> nlp = BosonNLP(os.environ['BOSON_API_TOKEN'], circuit_breaker=breaker)
+    >>> breaker.state('/ner/analysis')
+    'closed'
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, slow_call_duration=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_duration = slow_call_duration
+        self._lock = threading.Lock()
+        # endpoint -> [consecutive failures, opened at, trial request in progress]
+        self._circuits = {}
+
+    def state(self, endpoint):
+        """返回接口的熔断状态：``'closed'``、``'open'`` 或 ``'half_open'``。
+
+        使用多个后端时每个后端分别熔断，`endpoint` 后面加上后端的序号，
+        如 ``'/ner/analysis@0'`` 为 `bosonnlp_url` 和 `token`，``'/ner/analysis@1'`` 为
+        `backends` 中的第一个。
+        """
+        path, sep, backend = endpoint.partition('@')
+        with self._lock:
+            circuit = self._circuits.get(_endpoint_key(path) + sep + backend)
+            if circuit is None or circuit[1] is None:
+                return 'closed'
+            if circuit[2] or _monotonic() - circuit[1] >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def before_request(self, endpoint):
+        with self._lock:
+            circuit = self._circuits.setdefault(endpoint, [0, None, False])
+            failures, opened_at, trial = circuit
+            if opened_at is None:
+                return
+            if trial or _monotonic() - opened_at < self.reset_timeout:
+                raise CircuitOpenError('circuit for {0} is open'.format(endpoint), endpoint=endpoint)
+            circuit[2] = True
+
+    def record(self, endpoint, ok, elapsed):
+        if ok and self.slow_call_duration is not None and elapsed > self.slow_call_duration:
+            ok = False
+        with self._lock:
+            circuit = self._circuits.setdefault(endpoint, [0, None, False])
+            if ok:
+                circuit[:] = [0, None, False]
+                return
+            circuit[0] += 1
+            if circuit[2] or circuit[0] >= self.failure_threshold:
+                if circuit[1] is None:
+                    logger.warning('Circuit for %s opened after %d failures.' % (endpoint, circuit[0]))
+                circuit[1:] = [_monotonic(), False]
+
+
+# The endpoints that can safely be sent more than once.
+_IDEMPOTENT_ENDPOINTS = frozenset([
+    '/sentiment/analysis', '/classify/analysis', '/depparser/analysis', '/ner/analysis',
+    '/tag/analysis', '/suggest/analysis', '/keywords/analysis', '/time/analysis', '/summary/analysis',
+])
+
+
+class Hedger(object):
+    """对冲请求策略，用于降低分析接口的长尾延迟。
+
+    当一个请求在该接口近期延迟的 `percentile` 分位数时间内还没有返回时，
+    通过连接池中的另一个连接再发送一个相同的请求，采用先返回的结果。
+    有足够的延迟样本后，请求在复用的后台线程中发送，每个线程使用自己的 session，
+    不需要启用 `thread_safe`。
+    对冲请求数不超过总请求数的 `max_ratio`。只有幂等的分析接口会被对冲，
+    文本聚类和典型意见接口不受影响。
+
+    :param float max_ratio: 对冲请求数占总请求数的最大比例，默认为 0.05。
+
+    :param float percentile: 触发对冲的延迟分位数，默认为 95。
+
+    :param int min_samples: 接口至少有多少个延迟样本后才开始对冲，默认为 20。
+
+    :param int window: 每个接口保留最近多少个延迟样本，默认为 200。
+
+    >>> import os
+    >>> hedger = Hedger(max_ratio=0.05)
+    >>> nlp = BosonNLP(os.environ['BOSON_API_TOKEN'], hedger=hedger, thread_safe=True)
+    >>> hedger.stats()
+    {'hedge_wins': 0, 'hedged': 0, 'requests': 0}
+    """
+
+    def __init__(self, max_ratio=0.05, percentile=95, min_samples=20, window=200):
+        self.max_ratio = max_ratio
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._requests = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+
+    def delay(self, endpoint):
+        """Return how long to wait before hedging a request to ``endpoint``, or
+        :py:class:`None` while there are too few samples."""
+        with self._lock:
+            self._requests += 1
+            latencies = self._latencies.get(endpoint)
+            if latencies is None or len(latencies) < self.min_samples:
+                return None
+            latencies = sorted(latencies)
+        return latencies[min(int(len(latencies) * self.percentile / 100.0), len(latencies) - 1)]
+
+    def try_hedge(self, endpoint):
+        with self._lock:
+            if self._hedged + 1 > self.max_ratio * self._requests:
+                return False
+            self._hedged += 1
+            return True
+
+    def observe(self, endpoint, elapsed, won=False):
+        with self._lock:
+            latencies = self._latencies.get(endpoint)
+            if latencies is None:
+                latencies = self._latencies[endpoint] = deque(maxlen=self.window)
+            latencies.append(elapsed)
+            if won:
+                self._hedge_wins += 1
+
+    def stats(self):
+        """返回对冲统计。
+
+        :returns: dict，包含 ``requests``（可对冲的请求数）、``hedged``（发送的对冲请求数）
+            和 ``hedge_wins``（对冲请求先返回的次数）。
+        """
+        with self._lock:
+            return {'requests': self._requests, 'hedged': self._hedged, 'hedge_wins': self._hedge_wins}
+
+
+class _Backend(object):
+
+    def __init__(self, index, url, token, weight=1):
+        self.index = index
+        self.url = url.rstrip('/')
+        self.token = token
+        self.weight = weight
+        self.outstanding = 0
+        self.current_weight = 0
+        self.unavailable_until = None
+
+    def available(self, now):
+        return self.unavailable_until is None or self.unavailable_until <= now
+
+
+class _Balancer(object):
+    """Pick one of several backends for each request.
+
+    ``'round_robin'`` is nginx's smooth weighted round-robin, ``'least_outstanding'``
+    picks the backend with the fewest in-flight requests per unit of weight.
+    Backends put in cool-down by `mark_unavailable` are skipped until it ends,
+    unless every backend is cooling down.
+    """
+
+    # Seconds to avoid a backend after it ran out of quota or failed.
+    QUOTA_COOLDOWN = 60
+    FAILURE_COOLDOWN = 5
+
+    def __init__(self, backends, balancing='round_robin'):
+        if balancing not in ('round_robin', 'least_outstanding'):
+            raise ValueError('unknown balancing: {0!r}'.format(balancing))
+        self.backends = backends
+        self.balancing = balancing
+        self._lock = threading.Lock()
+
+    def acquire(self, exclude=(), pinned=None):
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude]
+            now = _monotonic()
+            available = [b for b in candidates if b.available(now)]
+            if pinned is not None:
+                backend = pinned
+            elif not available:
+                backend = min(candidates, key=lambda b: b.unavailable_until)
+            elif self.balancing == 'least_outstanding':
+                backend = min(available, key=lambda b: b.outstanding / float(b.weight))
+            else:
+                for b in available:
+                    b.current_weight += b.weight
+                backend = max(available, key=lambda b: b.current_weight)
+                backend.current_weight -= sum(b.weight for b in available)
+            backend.outstanding += 1
+            return backend
+
+    def release(self, backend):
+        with self._lock:
+            backend.outstanding -= 1
+
+    def mark_unavailable(self, backend, cooldown):
+        with self._lock:
+            backend.unavailable_until = _monotonic() + cooldown
+        logger.warning('Backend %s unavailable for %s seconds.' % (backend.url, cooldown))
+
+
+class _WorkerPool(object):
+    """Run calls on daemon threads, starting a new thread only when every
+    existing one is busy, so the number of threads follows the peak
+    concurrency instead of the number of calls.  A thread exits after
+    ``idle_timeout`` seconds without work.
+    """
+
+    def __init__(self, idle_timeout=60):
+        self.idle_timeout = idle_timeout
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        # Idle threads not yet claimed by a submitted call.
+        self._idle = 0
+
+    def submit(self, func, *args):
+        with self._lock:
+            start = not self._idle
+            if not start:
+                self._idle -= 1
+        if start:
+            thread = threading.Thread(target=self._work, name='bosonnlp-worker')
+            thread.daemon = True
+            thread.start()
+        self._tasks.put((func, args))
+
+    def _work(self):
+        _pool_local.active = True
+        while True:
+            try:
+                func, args = self._tasks.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    # With no unclaimed idle thread left, a call is on its way to this one.
+                    if self._idle:
+                        self._idle -= 1
+                        return
+                continue
+            func(*args)
+            # Don't keep the call, and whatever it references, alive while idle.
+            func = args = None
+            with self._lock:
+                self._idle += 1
+
+
+# Threads sending hedged requests, shared by all clients.
+_attempt_pool = _WorkerPool()
+
+
+def _clone_session(session):
+    """Create a new session with the same settings as ``session``.
+
+    The transport adapters (and so the underlying urllib3 connection pools,
+    which are thread-safe) are shared, so cloned sessions reuse the same
+    keep-alive connections instead of every thread opening its own.  The clone
+    has the same class as ``session`` and starts with a copy of its cookies.
+    """
+    clone = type(session)()
+    clone.cookies.update(session.cookies)
+    clone.headers = session.headers.copy()
+    clone.auth = session.auth
+    clone.proxies = dict(session.proxies)
+    clone.hooks = dict((event, list(hooks)) for event, hooks in session.hooks.items())
+    clone.params = dict(session.params)
+    clone.verify = session.verify
+    clone.cert = session.cert
+    clone.stream = session.stream
+    clone.trust_env = session.trust_env
+    clone.max_redirects = session.max_redirects
+    clone.adapters = session.adapters
+    return clone
+
+
 class BosonNLP(object):
     """BosonNLP HTTP API 访问的封装类。
 
@@ -55,41 +745,153 @@ class BosonNLP(object):
 
     :param bool compress: 是否压缩大于 10K 的请求体，默认为 True。
 
-    :param int timeout: HTTP 请求超时时间，默认为 60 秒。
+    :param timeout: HTTP 请求超时时间，默认为 60 秒。也可以是
+        (连接超时, 读取超时) 元组，分别设置建立连接和等待响应的超时时间。
+    :type timeout: float or tuple
+
+    :param bool thread_safe: 是否启用线程安全模式，默认为 False。启用后每个线程
+        使用独立的 :py:class:`requests.Session`，但共享同一个连接池，
+        可以在多线程间安全地共享同一个 :py:class:`~bosonnlp.BosonNLP` 实例。
+
+    :param int max_batch_size: 批量接口每次请求最多发送的文本数，默认为 100。
+
+    :param int max_batch_bytes: 批量接口每次请求的 JSON 请求体（压缩前）的目标大小，
+        默认为 512K。超出时会拆分成多次请求。
+
+    :param int cache_size: ``*_many`` 批量方法结果缓存的最大条数，默认为 1024，
+        设置为 0 表示不缓存。
+
+    :param float cache_ttl: 缓存结果的有效秒数，默认为 :py:class:`None`，表示不会过期。
+
+    :param circuit_breaker: 默认为 :py:class:`None`。指定
+        :py:class:`~bosonnlp.CircuitBreaker` 后，接口出错或过慢时快速失败，
+        抛出 :py:exc:`~bosonnlp.CircuitOpenError` 而不是等待超时。
+
+    :param hedger: 默认为 :py:class:`None`。指定 :py:class:`~bosonnlp.Hedger` 后，
+        对慢请求发送对冲请求以降低长尾延迟。
+
+    :param list backends: 默认为 :py:class:`None`。除 `bosonnlp_url` 和 `token` 之外的其他后端，
+        每项为 ``(url, token)`` 或 ``(url, token, weight)``，`weight` 默认为 1，
+        `bosonnlp_url` 和 `token` 的权重为 1。请求按 `balancing` 分配到各个后端；
+        返回 429 的后端在 60 秒内不再使用，连接错误、超时或返回 5xx 的后端在 5 秒内不再使用，
+        出错的请求会改发到其他后端。文本聚类和典型意见任务的所有请求都发送到创建任务的后端。
+
+    :param string balancing: 多个后端之间的负载均衡方式，``'round_robin'``（默认）按权重轮流使用，
+        ``'least_outstanding'`` 使用正在处理的请求数与权重之比最小的后端。
+
+    :param task_registry: 默认为 :py:class:`None`。指定
+        :py:class:`~bosonnlp.registry.TaskRegistry` 后，创建的文本聚类和典型意见任务
+        会被记录下来，清空后删除记录，以便清理进程异常退出时遗留的任务。
 
     """
 
-    def __init__(self, token, bosonnlp_url=DEFAULT_BOSONNLP_URL, compress=True, session=None, timeout=60):
+    def __init__(self, token, bosonnlp_url=DEFAULT_BOSONNLP_URL, compress=True, session=None, timeout=60,
+                 thread_safe=False, max_batch_size=DEFAULT_BATCH_SIZE, max_batch_bytes=DEFAULT_BATCH_BYTES,
+                 cache_size=DEFAULT_CACHE_SIZE, cache_ttl=None, circuit_breaker=None, hedger=None,
+                 backends=None, balancing='round_robin', task_registry=None):
         self.token = token
         self.bosonnlp_url = bosonnlp_url.rstrip('/')
         self.compress = compress
         self.timeout = timeout
+        self.thread_safe = thread_safe
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.circuit_breaker = circuit_breaker
+        self.hedger = hedger
+        self.task_registry = task_registry
+        self._summary_cache = _LRUCache(cache_size, cache_ttl)
+        self._suggest_cache = _LRUCache(cache_size, cache_ttl)
+        self._keywords_cache = _LRUCache(cache_size, cache_ttl)
+        self._balancer = None
+        if backends:
+            backends = [(self.bosonnlp_url, token)] + list(backends)
+            self._balancer = _Balancer([_Backend(i, *backend) for i, backend in enumerate(backends)], balancing)
+        # task_id -> the backend that cluster or comments task was created on.
+        self._task_backends = {}
+        self._task_lock = threading.Lock()
 
         # Enable keep-alive and connection-pooling.
         self.session = session or requests.session()
-        self.session.headers['X-Token'] = token
-        self.session.headers['Accept'] = 'application/json'
-        self.session.headers['User-Agent'] = 'bosonnlp.py/{} {}'.format(
+        self._session.headers['X-Token'] = token
+        self._session.headers['Accept'] = 'application/json'
+        self._session.headers['User-Agent'] = 'bosonnlp.py/{} {}'.format(
             __VERSION__, requests.utils.default_user_agent()
         )
 
-    def _api_request(self, method, path, **kwargs):
+    @property
+    def session(self):
+        """发送请求使用的 :py:class:`requests.Session`。
+
+        线程安全模式下，以及在 ``*_many`` 等方法内部并发发送请求的线程中，
+        返回当前线程专用的 session，它与其他线程共享连接池。
+        """
+        if not self.thread_safe and not getattr(_pool_local, 'active', False):
+            return self._session
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = _clone_session(self._session)
+        return session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+        self._local = threading.local()
+
+    def _encode_body(self, body):
+        """Return the :py:class:`_EncodedBody` for sending the JSON encoded ``body``."""
+        headers = {'Content-Type': 'application/json'}
+        if len(body) > 10 * 1024 and self.compress:  # 10K
+            headers['Content-Encoding'] = 'gzip'
+            body = _gzip_compress(body)
+        return _EncodedBody(body, headers)
+
+    def deadline(self, seconds):
+        """限制一段代码中所有 API 调用的总耗时。
+
+        返回一个上下文管理器。在其中发起的每个请求的超时时间都不会超过剩余的时间，
+        剩余时间用完后再发起请求会立即抛出 :py:exc:`~bosonnlp.TimeoutError`。
+        这个限制覆盖分批发送的所有请求、``*_many`` 方法在其他线程中发起的请求，
+        以及 :py:meth:`~bosonnlp.ClusterTask.wait_until_complete` 的等待时间。
+        嵌套使用时以先到期的为准。
+
+        :param float seconds: 总耗时的秒数。
+
+        调用示例：
+
+        >>> import os
+        >>> nlp = BosonNLP(os.environ['BOSON_API_TOKEN'], timeout=(3.05, 30))
+        >>> with nlp.deadline(2):
+        ...     nlp.tag(texts)
+        """
+        deadline = _monotonic() + seconds
+        current = _get_deadline()
+        if current is not None:
+            deadline = min(deadline, current)
+        return _deadline_scope(deadline)
+
+    def _api_request(self, method, path, body=None, **kwargs):
         kwargs.setdefault('timeout', self.timeout)
-        url = self.bosonnlp_url + path
+        remaining = _remaining()
+        if remaining is not None:
+            if remaining <= 0:
+                raise TimeoutError('deadline exceeded before {0} {1}'.format(method, path))
+            kwargs['timeout'] = _cap_timeout(kwargs['timeout'], remaining)
         if method == 'POST':
             if 'data' in kwargs:
-                headers = kwargs.get('headers', {})
-                headers['Content-Type'] = 'application/json'
-                data = _json_dumps(kwargs['data'])
-                if isinstance(data, text_type):
-                    data = data.encode('utf-8')
-                if len(data) > 10 * 1024 and self.compress:  # 10K
-                    headers['Content-Encoding'] = 'gzip'
-                    data = _gzip_compress(data)
-                kwargs['data'] = data
+                body = _encode_json(kwargs['data'])
+            if body is not None:
+                if not isinstance(body, _EncodedBody):
+                    body = self._encode_body(body)
+                headers = dict(kwargs.get('headers') or {})
+                headers.update(body.headers)
+                kwargs['data'] = body.data
                 kwargs['headers'] = headers
 
-        r = self.session.request(method, url, **kwargs)
+        endpoint = _endpoint_key(path)
+        if self._balancer is None:
+            r = self._request(endpoint, endpoint, method, self.bosonnlp_url + path, kwargs)
+        else:
+            r = self._balanced_request(endpoint, method, path, kwargs)
 
         http_error_msg = ''
 
@@ -106,16 +908,204 @@ class BosonNLP(object):
 
         return r
 
-    def sentiment(self, contents, model='general'):
+    def _request(self, circuit, endpoint, method, url, kwargs):
+        breaker = self.circuit_breaker
+        if breaker is None:
+            return self._send(endpoint, method, url, kwargs)
+        breaker.before_request(circuit)
+        start = _monotonic()
+        try:
+            r = self._send(endpoint, method, url, kwargs)
+        except BaseException:
+            # Always record the outcome, or a half-open circuit would wait for its trial forever.
+            breaker.record(circuit, False, _monotonic() - start)
+            raise
+        # With several backends, the balancer already routes around an exhausted quota.
+        failed = r.status_code >= 500 or (r.status_code == 429 and self._balancer is None)
+        breaker.record(circuit, not failed, _monotonic() - start)
+        return r
+
+    def _pin_task(self, task_id, index=None):
+        """Pin ``task_id`` to the backend at ``index``, or to the next one the
+        balancer picks, and return that backend's index (None without backends).
+        """
+        balancer = self._balancer
+        if balancer is None:
+            return None
+        if index is not None and index < len(balancer.backends):
+            backend = balancer.backends[index]
+        else:
+            backend = balancer.acquire()
+            balancer.release(backend)
+        with self._task_lock:
+            return self._task_backends.setdefault(task_id, backend).index
+
+    def _balanced_request(self, endpoint, method, path, kwargs):
+        balancer = self._balancer
+        task_id = None
+        if endpoint.startswith(('/cluster/', '/comments/')):
+            task_id = path.split('?', 1)[0].strip('/').split('/')[2]
+        tried = []
+        while True:
+            with self._task_lock:
+                pinned = self._task_backends.get(task_id)
+            backend = balancer.acquire(exclude=tried, pinned=pinned)
+            if task_id is not None:
+                with self._task_lock:
+                    self._task_backends.setdefault(task_id, backend)
+            tried.append(backend)
+            # The task only exists on its backend, so only analysis requests fail over.
+            can_retry = task_id is None and len(tried) < len(balancer.backends)
+
+            attempt = dict(kwargs)
+            attempt['headers'] = dict(kwargs.get('headers') or {})
+            attempt['headers']['X-Token'] = backend.token
+            remaining = _remaining()
+            if remaining is not None:
+                attempt['timeout'] = _cap_timeout(kwargs['timeout'], remaining)
+            try:
+                circuit = '{0}@{1}'.format(endpoint, backend.index)
+                r = self._request(circuit, endpoint, method, backend.url + path, attempt)
+            except (requests.ConnectionError, requests.Timeout, CircuitOpenError) as e:
+                if not isinstance(e, CircuitOpenError):
+                    balancer.mark_unavailable(backend, balancer.FAILURE_COOLDOWN)
+                if not can_retry or (remaining is not None and _remaining() <= 0):
+                    raise
+                continue
+            finally:
+                balancer.release(backend)
+
+            if r.status_code == 429 or r.status_code >= 500:
+                balancer.mark_unavailable(
+                    backend, balancer.QUOTA_COOLDOWN if r.status_code == 429 else balancer.FAILURE_COOLDOWN)
+                if can_retry and (remaining is None or _remaining() > 0):
+                    continue
+            if endpoint.endswith('/clear'):
+                with self._task_lock:
+                    self._task_backends.pop(task_id, None)
+            return r
+
+    def _send(self, endpoint, method, url, kwargs):
+        hedger = self.hedger
+        if hedger is None or endpoint not in _IDEMPOTENT_ENDPOINTS:
+            return self.session.request(method, url, **kwargs)
+
+        delay = hedger.delay(endpoint)
+        start = _monotonic()
+        if delay is None:
+            r = self.session.request(method, url, **kwargs)
+            hedger.observe(endpoint, _monotonic() - start)
+            return r
+
+        answers = queue.Queue()
+
+        # Both attempts run on pooled threads, each with its own session, so
+        # the one left running never shares a session with the next request.
+        def attempt(hedged):
+            try:
+                answers.put((hedged, self.session.request(method, url, **kwargs), None))
+            except Exception as e:
+                answers.put((hedged, None, e))
+
+        def spawn(hedged):
+            _attempt_pool.submit(attempt, hedged)
+
+        spawn(False)
+        attempts = 1
+        try:
+            answer = answers.get(timeout=delay)
+        except queue.Empty:
+            if hedger.try_hedge(endpoint):
+                spawn(True)
+                attempts = 2
+            answer = answers.get()
+        # Prefer a response over an error, if the other attempt is still running.
+        if answer[2] is not None and attempts == 2:
+            other = answers.get()
+            if other[2] is None:
+                answer = other
+        hedged, r, error = answer
+        if error is not None:
+            raise error
+        hedger.observe(endpoint, _monotonic() - start, won=hedged)
+        return r
+
+    def _analysis_request(self, api_endpoint, contents, params=None, dedup=False, max_length=None,
+                          merge=_merge_words, fields=None, sink=None):
+        payload = _as_payload(contents)
+        if sink is not None and (payload is not None or max_length or dedup or isinstance(contents, string_types)):
+            # Merged or deduplicated results are only complete once every batch has returned.
+            results = self._analysis_request(api_endpoint, contents, params, dedup, max_length, merge, fields)
+            return _write_to_sink(sink, results)
+        if payload is not None:
+            r = self._api_request('POST', api_endpoint, params=params, body=payload._encoded())
+            return r.json(object_pairs_hook=_projection(fields))
+        if max_length:
+            if isinstance(contents, string_types):
+                contents = [contents]
+            documents = [_split_text(text, max_length) for text in contents]
+            pieces = [piece for document in documents for piece in document]
+            if len(pieces) > len(documents):
+                logger.info('Split %d documents into %d pieces.' % (len(documents), len(pieces)))
+            decoded = fields
+            if fields is not None and merge is _merge_words and 'word' not in fields:
+                # Merging counts offsets in words.
+                decoded = list(fields) + ['word']
+            results = self._analysis_request(api_endpoint, pieces, params, dedup, fields=decoded)
+            merged = []
+            i = 0
+            for document in documents:
+                n = len(document)
+                merged.append(results[i] if n == 1 else merge(document, results[i:i + n]))
+                i += n
+            if decoded is not fields:
+                for result in merged:
+                    result.pop('word', None)
+            return merged
+        if dedup and not isinstance(contents, string_types):
+            unique, positions = _dedup(contents)
+            if len(unique) < len(positions):
+                logger.info('Sending %d unique of %d documents.' % (len(unique), len(positions)))
+                results = self._analysis_request(api_endpoint, unique, params, fields=fields)
+                return [results[pos] for pos in positions]
+        hook = _projection(fields)
+        if isinstance(contents, string_types):
+            r = self._api_request('POST', api_endpoint, params=params, data=contents)
+            return r.json(object_pairs_hook=hook)
+        results = []
+        count = 0
+        for _, body in _iter_chunks(contents, self.max_batch_size, self.max_batch_bytes):
+            r = self._api_request('POST', api_endpoint, params=params, body=body)
+            if sink is None:
+                results.extend(r.json(object_pairs_hook=hook))
+            else:
+                count += _write_to_sink(sink, r.json(object_pairs_hook=hook), count)
+        return results if sink is None else count
+
+    def sentiment(self, contents, model='general', dedup=False, max_length=None, weighting='length',
+                  sink=None):
         """BosonNLP `情感分析接口 <http://docs.bosonnlp.com/sentiment.html>`_ 封装。
 
         :param contents: 需要做情感分析的文本或者文本序列。
-        :type contents: string or sequence of string
+        :type contents: string or sequence of string or :py:class:`~bosonnlp.Payload`
 
         :param model: 使用不同语料训练的模型，默认使用通用模型。
         :type model: string
 
-        :returns: 接口返回的结果列表。
+        :param bool dedup: 默认为 False，是否只发送一次重复的文本，并将结果填回所有
+            重复的位置。重复文本的结果是同一个对象。
+
+        :param int max_length: 默认为 :py:class:`None`。超过该字数的文本会在句子边界处
+            拆分成多段分批分析，再合并为一个结果。
+
+        :param weighting: 合并长文本各段的情感概率时使用的权重。``'length'`` 按各段字数
+            加权（默认），``'uniform'`` 取平均，也可以传入以段落文本为参数、返回权重的函数。
+
+        :param sink: 默认为 :py:class:`None`。如果指定，每批结果一返回就写入该
+            :py:class:`~bosonnlp.sinks.Sink`，不在内存中保留。同时指定 `dedup` 或
+            `max_length` 时需要所有批次返回后才能合并结果，届时再一并写入。
+
+        :returns: 接口返回的结果列表；如果指定了 `sink`，则返回写入的结果数。
 
         :raises: :py:exc:`~bosonnlp.HTTPError` 如果 API 请求发生错误。
 
@@ -130,8 +1120,8 @@ class BosonNLP(object):
          [9.940036427291687e-08, 0.9999999005996357]]
         """
         api_endpoint = '/sentiment/analysis?' + model
-        r = self._api_request('POST', api_endpoint, data=contents)
-        return r.json()
+        return self._analysis_request(api_endpoint, contents, dedup=dedup, max_length=max_length,
+                                      merge=_sentiment_merger(weighting), sink=sink)
 
     def convert_time(self, content, basetime=None):
         """BosonNLP `时间描述转换接口 <http://docs.bosonnlp.com/time.html>`_ 封装
@@ -166,13 +1156,52 @@ class BosonNLP(object):
         r = self._api_request('POST', api_endpoint, params=params)
         return r.json()
 
-    def classify(self, contents):
+    def convert_time_batch(self, contents, basetime=None, workers=DEFAULT_WORKERS):
+        """并发调用 :py:meth:`convert_time` 批量转换时间描述。
+
+        重复的时间描述（如“今天”、“昨天下午”）只会请求一次。
+
+        :param contents: 中文时间描述字符串序列。
+        :type contents: sequence of string
+
+        :param basetime: 所有时间描述共同的基准时间，传入一个时间戳或datetime
+        :type basetime: int or datetime.datetime
+
+        :param int workers: 并发请求数，默认为 8。
+
+        :returns: 与 `contents` 顺序一致的结果列表。请求出错的位置是对应的异常对象，
+            不会影响其他结果。
+
+        调用示例：
+
+        >>> import os
+        >>> nlp = BosonNLP(os.environ['BOSON_API_TOKEN'])
+        >>> import datetime
+        >>> nlp.convert_time_batch(['今天晚上8点', '明天下午3点', '今天晚上8点'],
+        ...                        datetime.datetime(2015, 9, 1))
+        [{'timestamp': '2015-09-01 20:00:00', 'type': 'timestamp'},
+         {'timestamp': '2015-09-02 15:00:00', 'type': 'timestamp'},
+         {'timestamp': '2015-09-01 20:00:00', 'type': 'timestamp'}]
+        """
+        unique, positions = _dedup(contents)
+        convert = partial(self.convert_time, basetime=basetime)
+        results = list(_thread_imap(convert, unique, workers))
+        return [results[pos] for pos in positions]
+
+    def classify(self, contents, dedup=False, sink=None):
         """BosonNLP `新闻分类接口 <http://docs.bosonnlp.com/classify.html>`_ 封装。
 
         :param contents: 需要做分类的新闻文本或者文本序列。
-        :type contents: string or sequence of string
+        :type contents: string or sequence of string or :py:class:`~bosonnlp.Payload`
 
-        :returns: 接口返回的结果列表。
+        :param bool dedup: 默认为 False，是否只发送一次重复的文本，并将结果填回所有
+            重复的位置。重复文本的结果是同一个对象。
+
+        :param sink: 默认为 :py:class:`None`。如果指定，每批结果一返回就写入该
+            :py:class:`~bosonnlp.sinks.Sink`，不在内存中保留。同时指定 `dedup` 时
+            需要所有批次返回后才能填回结果，届时再一并写入。
+
+        :returns: 接口返回的结果列表；如果指定了 `sink`，则返回写入的结果数。
 
         :raises: :py:exc:`~bosonnlp.HTTPError` 如果 API 请求发生错误。
 
@@ -188,8 +1217,7 @@ class BosonNLP(object):
         [5, 4, 8]
         """
         api_endpoint = '/classify/analysis'
-        r = self._api_request('POST', api_endpoint, data=contents)
-        return r.json()
+        return self._analysis_request(api_endpoint, contents, dedup=dedup, sink=sink)
 
     def suggest(self, word, top_k=None):
         """BosonNLP `语义联想接口 <http://docs.bosonnlp.com/suggest.html>`_ 封装。
@@ -246,13 +1274,83 @@ class BosonNLP(object):
         r = self._api_request('POST', api_endpoint, params=params, data=text)
         return r.json()
 
-    def depparser(self, contents):
+    def suggest_many(self, words, top_k=None, workers=DEFAULT_WORKERS):
+        """并发调用 :py:meth:`suggest` 批量做语义联想。
+
+        结果按词缓存，之后以相同或更小的 `top_k` 联想同一个词时直接截取缓存的结果。
+
+        :param words: 需要做语义联想的词序列。
+        :type words: sequence of string
+
+        :param int workers: 并发请求数，默认为 8。
+
+        其他参数和 :py:meth:`suggest` 一致。
+
+        :returns: 与 `words` 顺序一致的结果列表。请求出错的位置是对应的异常对象，
+            不会影响其他结果。
+
+        调用示例：
+
+        >>> import os
+        >>> nlp = BosonNLP(os.environ['BOSON_API_TOKEN'])
+        >>> nlp.suggest_many(['北京', '上海'], top_k=1)
+        [[[1.0, '北京/ns']], [[1.0, '上海/ns']]]
+        """
+        def suggest(word):
+            return _cached_top_k(self._suggest_cache, word, top_k or 10,
+                                 partial(self.suggest, word))
+
+        unique, positions = _dedup(words)
+        results = list(_thread_imap(suggest, unique, workers))
+        return [results[pos] for pos in positions]
+
+    def extract_keywords_many(self, texts, top_k=None, segmented=False, workers=DEFAULT_WORKERS):
+        """并发调用 :py:meth:`extract_keywords` 批量提取关键词。
+
+        结果按文本内容缓存，之后以相同或更小的 `top_k` 处理同一文本时直接截取缓存的结果。
+
+        :param texts: 需要做关键词提取的文本序列。
+        :type texts: sequence of string
+
+        :param int workers: 并发请求数，默认为 8。
+
+        其他参数和 :py:meth:`extract_keywords` 一致。
+
+        :returns: 与 `texts` 顺序一致的结果列表。请求出错的位置是对应的异常对象，
+            不会影响其他结果。
+        """
+        import hashlib
+
+        def extract_keywords(text):
+            key = (hashlib.sha1(_encode_json(text)).hexdigest(), bool(segmented))
+            return _cached_top_k(self._keywords_cache, key, top_k or 100,
+                                 partial(self.extract_keywords, text, segmented=segmented))
+
+        unique, positions = _dedup(texts)
+        results = list(_thread_imap(extract_keywords, unique, workers))
+        return [results[pos] for pos in positions]
+
+    def depparser(self, contents, dedup=False, max_length=None, fields=None, sink=None):
         """BosonNLP `依存文法分析接口 <http://docs.bosonnlp.com/depparser.html>`_ 封装。
 
         :param contents: 需要做依存文法分析的文本或者文本序列。
-        :type contents: string or sequence of string
+        :type contents: string or sequence of string or :py:class:`~bosonnlp.Payload`
 
-        :returns: 接口返回的结果列表。
+        :param bool dedup: 默认为 False，是否只发送一次重复的文本，并将结果填回所有
+            重复的位置。重复文本的结果是同一个对象。
+
+        :param int max_length: 默认为 :py:class:`None`。超过该字数的文本会在句子边界处
+            拆分成多段分批分析，再合并为一个结果，`head` 中的词序号会换算为整篇文本中的位置。
+
+        :param fields: 默认为 :py:class:`None`，表示返回所有字段。否则为需要的字段名序列，
+            如 ``['head']``，其他字段在解码响应时即被丢弃，不会保留在结果中。
+        :type fields: sequence of string
+
+        :param sink: 默认为 :py:class:`None`。如果指定，每批结果一返回就写入该
+            :py:class:`~bosonnlp.sinks.Sink`，不在内存中保留。同时指定 `dedup` 或
+            `max_length` 时需要所有批次返回后才能合并结果，届时再一并写入。
+
+        :returns: 接口返回的结果列表；如果指定了 `sink`，则返回写入的结果数。
 
         :raises: :py:exc:`~bosonnlp.HTTPError` 如果 API 请求发生错误。
 
@@ -276,14 +1374,15 @@ class BosonNLP(object):
           'word': ['美好', '的', '世界']}]
         """
         api_endpoint = '/depparser/analysis'
-        r = self._api_request('POST', api_endpoint, data=contents)
-        return r.json()
+        return self._analysis_request(api_endpoint, contents, dedup=dedup, max_length=max_length, fields=fields,
+                                      sink=sink)
 
-    def ner(self, contents, sensitivity=None, segmented=False, space_mode='3'):
+    def ner(self, contents, sensitivity=None, segmented=False, space_mode='3', dedup=False, max_length=None,
+            fields=None, sink=None):
         """BosonNLP `命名实体识别接口 <http://docs.bosonnlp.com/ner.html>`_ 封装。
 
         :param contents: 需要做命名实体识别的文本或者文本序列。
-        :type contents: string or sequence of string
+        :type contents: string or sequence of string or :py:class:`~bosonnlp.Payload`
 
         :param sensitivity: 准确率与召回率之间的平衡，
             设置成 1 能找到更多的实体，设置成 5 能以更高的精度寻找实体。
@@ -295,7 +1394,21 @@ class BosonNLP(object):
         :param space_mode: 分词空格保留选项
         :type space_mode: int（整型）, 0-3有效，默认为 3
 
-        :returns: 接口返回的结果列表。
+        :param bool dedup: 默认为 False，是否只发送一次重复的文本，并将结果填回所有
+            重复的位置。重复文本的结果是同一个对象。
+
+        :param int max_length: 默认为 :py:class:`None`。超过该字数的文本会在句子边界处
+            拆分成多段分批分析，再合并为一个结果，`entity` 中的词序号会换算为整篇文本中的位置。
+
+        :param fields: 默认为 :py:class:`None`，表示返回所有字段。否则为需要的字段名序列，
+            如 ``['entity']``，其他字段在解码响应时即被丢弃，不会保留在结果中。
+        :type fields: sequence of string
+
+        :param sink: 默认为 :py:class:`None`。如果指定，每批结果一返回就写入该
+            :py:class:`~bosonnlp.sinks.Sink`，不在内存中保留。同时指定 `dedup` 或
+            `max_length` 时需要所有批次返回后才能合并结果，届时再一并写入。
+
+        :returns: 接口返回的结果列表；如果指定了 `sink`，则返回写入的结果数。
 
         :raises: :py:exc:`~bosonnlp.HTTPError` 如果 API 请求发生错误。
 
@@ -328,14 +1441,15 @@ class BosonNLP(object):
         if segmented:
             params['segmented'] = True
 
-        r = self._api_request('POST', api_endpoint, data=contents, params=params)
-        return r.json()
+        return self._analysis_request(api_endpoint, contents, params, dedup=dedup, max_length=max_length,
+                                      fields=fields, sink=sink)
 
-    def tag(self, contents, space_mode=0, oov_level=3, t2s=0, special_char_conv=0):
+    def tag(self, contents, space_mode=0, oov_level=3, t2s=0, special_char_conv=0, dedup=False,
+            max_length=None, fields=None, sink=None):
         """BosonNLP `分词与词性标注 <http://docs.bosonnlp.com/tag.html>`_ 封装。
 
         :param contents: 需要做分词与词性标注的文本或者文本序列。
-        :type contents: string or sequence of string
+        :type contents: string or sequence of string or :py:class:`~bosonnlp.Payload`
 
         :param space_mode: 空格保留选项
         :type space_mode: int（整型）, 0-3有效
@@ -349,7 +1463,21 @@ class BosonNLP(object):
         :param special_char_conv: 特殊字符转化选项，针对回车、Tab等特殊字符转化或者不转化
         :type special_char_conv:  int（整型）, 0-1有效
 
-        :returns: 接口返回的结果列表。
+        :param bool dedup: 默认为 False，是否只发送一次重复的文本，并将结果填回所有
+            重复的位置。重复文本的结果是同一个对象。
+
+        :param int max_length: 默认为 :py:class:`None`。超过该字数的文本会在句子边界处
+            拆分成多段分批分析，再合并为一个结果。
+
+        :param fields: 默认为 :py:class:`None`，表示返回所有字段。否则为需要的字段名序列，
+            如 ``['word']``，其他字段在解码响应时即被丢弃，不会保留在结果中。
+        :type fields: sequence of string
+
+        :param sink: 默认为 :py:class:`None`。如果指定，每批结果一返回就写入该
+            :py:class:`~bosonnlp.sinks.Sink`，不在内存中保留。同时指定 `dedup` 或
+            `max_length` 时需要所有批次返回后才能合并结果，届时再一并写入。
+
+        :returns: 接口返回的结果列表；如果指定了 `sink`，则返回写入的结果数。
 
         :raises: :py:exc:`~bosonnlp.HTTPError` 如果 API 请求发生错误。
 
@@ -387,8 +1515,75 @@ class BosonNLP(object):
             't2s': t2s,
             'special_char_conv': special_char_conv,
         }
-        r = self._api_request('POST', api_endpoint, params=params, data=contents)
-        return r.json()
+        return self._analysis_request(api_endpoint, contents, params, dedup=dedup, max_length=max_length,
+                                      fields=fields, sink=sink)
+
+    def analyze(self, contents, tasks=('tag', 'ner', 'sentiment', 'classify'), workers=DEFAULT_WORKERS):
+        """对每篇文本同时调用多个分析接口，并把结果合并为每篇文本一条记录。
+
+        批量接口的请求体对每批文本只编码、压缩一次，在各个接口之间复用；
+        所有请求并发发送。各接口使用与对应方法相同的默认参数。
+
+        :param contents: 需要分析的文本或者文本序列。
+        :type contents: string or sequence of string or :py:class:`~bosonnlp.Payload`
+
+        :param tasks: 需要调用的接口，可以是 ``sentiment``、``classify``、``depparser``、
+            ``ner``、``tag`` 以及 ``keywords``（对每篇文本调用
+            :py:meth:`extract_keywords`）。默认为 ``('tag', 'ner', 'sentiment', 'classify')``。
+        :type tasks: sequence of string
+
+        :param int workers: 并发请求数，默认为 8。
+
+        :returns: 每篇文本一个 dict 的列表，以接口名为键。
+
+        :raises: :py:exc:`~bosonnlp.HTTPError` 如果 API 请求发生错误。
+
+        调用示例：
+
+        >>> import os
+        >>> nlp = BosonNLP(os.environ['BOSON_API_TOKEN'])
+        >>> nlp.analyze('俄否决安理会谴责叙军战机空袭阿勒颇平民', tasks=['classify', 'sentiment'])
+        [{'classify': 5, 'sentiment': [0.3251201402642689, 0.6748798597357311]}]
+        """
+        unknown = set(tasks) - set(_BATCH_APIS) - set(['keywords'])
+        if unknown:
+            raise ValueError('unknown analysis tasks: {0}'.format(', '.join(sorted(unknown))))
+        if isinstance(contents, string_types):
+            contents = [contents]
+
+        jobs = []
+        payload = _as_payload(contents)
+        if payload is not None:
+            if 'keywords' in tasks:
+                raise ValueError('keywords can not be extracted from a pre-encoded payload')
+            body = payload._encoded()
+            jobs.extend((task, 0, body) for task in tasks)
+            contents = []
+        start = 0
+        for chunk, body in _iter_chunks(contents, self.max_batch_size, self.max_batch_bytes):
+            body = self._encode_body(body)
+            jobs.extend((task, start, body) for task in tasks if task in _BATCH_APIS)
+            start += len(chunk)
+        if 'keywords' in tasks:
+            jobs.extend(('keywords', i, None) for i in range(len(contents)))
+
+        def run(job):
+            task, start, body = job
+            if task == 'keywords':
+                return [self.extract_keywords(contents[start])]
+            api_endpoint, params = _BATCH_APIS[task]
+            return self._api_request('POST', api_endpoint, params=params, body=body).json()
+
+        records = [{} for _ in contents]
+        for (task, start, _), results in zip(jobs, _thread_imap(run, jobs, workers)):
+            if isinstance(results, Exception):
+                raise results
+            for i, result in enumerate(results, start):
+                if i == len(records):
+                    # The number of documents in a payload is only known from its results.
+                    records.append({})
+                records[i][task] = result
+        return records
 
     def summary(self, title, content, word_limit=0.3, not_exceed=False):
         """BosonNLP `新闻摘要 <http://docs.bosonnlp.com/summary.html>`_ 封装。
@@ -449,15 +1644,50 @@ class BosonNLP(object):
         r = self._api_request('POST', api_endpoint, data=data)
         return r.json()
 
+    def summary_many(self, articles, word_limit=0.3, not_exceed=False, workers=DEFAULT_WORKERS):
+        """并发调用 :py:meth:`summary` 为大量新闻生成摘要。
+
+        结果按正文内容的哈希值和字数限制缓存，重复的新闻不会再次请求。
+
+        :param articles: (title, content) 序列，可以是任意可迭代对象，会被按需读取。
+
+        :param int workers: 并发请求数，默认为 8。
+
+        其他参数和 :py:meth:`summary` 一致。
+
+        :returns: 按输入顺序逐个产生摘要的迭代器。请求出错的位置是对应的异常对象，
+            不会影响其他结果。
+
+        调用示例：
+
+        >>> import os
+        >>> nlp = BosonNLP(os.environ['BOSON_API_TOKEN'])
+        >>> for summary in nlp.summary_many(articles, word_limit=0.1):
+        ...     print(summary)
+        """
+        import hashlib
+
+        def summarize(article):
+            title, content = article
+            key = (hashlib.sha1(_encode_json([title, content])).hexdigest(), word_limit, bool(not_exceed))
+            result = self._summary_cache.get(key)
+            if result is None:
+                result = self.summary(title, content, word_limit, not_exceed)
+                self._summary_cache.set(key, result)
+            return result
+
+        return _thread_imap(summarize, articles, workers)
+
     def _cluster_push(self, task_id, contents):
         api_endpoint = '/cluster/push/' + task_id
         contents = ClusterTask._prepare_contents(contents)
         if not contents:
             return False
-        for i in range(0, len(contents), 100):
-            chunk = contents[i:i + 100]
-            r = self._api_request('POST', api_endpoint, data=chunk)
-            logger.info('Pushed %d of %d documents for clustering.' % (i+len(chunk), len(contents)))
+        pushed = 0
+        for chunk, body in _iter_chunks(contents, self.max_batch_size, self.max_batch_bytes):
+            r = self._api_request('POST', api_endpoint, body=body)
+            pushed += len(chunk)
+            logger.info('Pushed %d of %d documents for clustering.' % (pushed, len(contents)))
         return r.ok
 
     def _cluster_analysis(self, task_id, alpha=None, beta=None):
@@ -493,12 +1723,13 @@ class BosonNLP(object):
         logger.info('%d comments fetched.' % len(v))
         return v
 
-    def _cluster_clear(self, task_id):
+    def _cluster_clear(self, task_id, **kwargs):
         api_endpoint = '/cluster/clear/' + task_id
-        r = self._api_request('GET', api_endpoint)
+        r = self._api_request('GET', api_endpoint, **kwargs)
         return r.ok
 
-    def cluster(self, contents, task_id=None, alpha=None, beta=None, timeout=DEFAULT_TIMEOUT):
+    def cluster(self, contents, task_id=None, alpha=None, beta=None, timeout=DEFAULT_TIMEOUT,
+                simhash_distance=None, shards=None, compact_ids=False):
         """BosonNLP `文本聚类接口 <http://docs.bosonnlp.com/cluster.html>`_ 封装。
 
         :param contents: 需要做文本聚类的文本序列或者 (_id, text) 序列或者
@@ -516,6 +1747,19 @@ class BosonNLP(object):
 
         :param float timeout: 默认为 1800 秒（30 分钟），等待文本聚类任务完成的秒数。
 
+        :param int simhash_distance: 默认为 :py:class:`None`，表示不做近似去重。
+            否则在上传前用 SimHash 合并指纹汉明距离不超过该值的近似重复文本，
+            只上传一条代表文本，结果中的 `list` 会展开回原来的 _id。
+
+        :param int shards: 默认为 :py:class:`None`。大于 1 时把文本分成 `shards` 份，
+            同时创建多个文本聚类任务分别处理，再对各份结果的代表文本做一次文本聚类，
+            把相近的合并起来。适用于单个任务处理不了或太慢的大量文本。
+            某一份中未能成为 cluster 的文本也会参与合并，可以与其他份中的相近文本组成 cluster。
+
+        :param bool compact_ids: 默认为 False。为 True 时上传文本使用从 0 开始的整数 _id，
+            本地保存整数到原 _id 的对应关系，获取结果时再换回原来的 _id，
+            以减小上传和结果的数据量。多个客户端向同一个任务上传文本时不能使用。
+
         :returns: 接口返回的结果列表。
 
         :raises:
@@ -538,18 +1782,70 @@ class BosonNLP(object):
             return []
         if isinstance(contents[0], string_types):
             contents = [{"_id": _id, "text": s} for _id, s in enumerate(contents)]
-        cluster = None
-        try:
-            cluster = self.create_cluster_task(contents, task_id)
+        if shards and shards > 1:
+            return self._sharded('cluster', contents, shards, task_id, alpha, beta, timeout, simhash_distance,
+                                 compact_ids)
+        with self.create_cluster_task(contents, task_id, simhash_distance, compact_ids) as cluster:
             cluster.analysis(alpha=alpha, beta=beta)
             cluster.wait_until_complete(timeout)
-            result = cluster.result()
-            return result
-        finally:
-            if cluster is not None:
-                cluster.clear()
-
-    def create_cluster_task(self, contents=None, task_id=None):
+            return cluster.result()
+
+    def _sharded(self, kind, contents, shards, task_id, alpha, beta, timeout, simhash_distance, compact_ids):
+        contents = _ClusterTask._prepare_contents(contents)
+        parts = [contents[i::shards] for i in range(shards)]
+        run = getattr(self, kind)
+
+        def run_shard(i):
+            shard_task_id = '{0}{1}'.format(task_id, i) if task_id is not None else None
+            return run(parts[i], shard_task_id, alpha, beta, timeout, simhash_distance, compact_ids=compact_ids)
+
+        groups = []
+        for result in _thread_imap(run_shard, range(shards), shards):
+            if isinstance(result, Exception):
+                raise result
+            groups.extend(result)
+        # Documents left unclustered in their shard may have near-duplicates in
+        # other shards, so they join the second pass as singleton groups.
+        if kind == 'cluster':
+            clustered = set(_id for group in groups for _id in group['list'])
+            groups.extend({'_id': doc['_id'], 'list': [doc['_id']], 'num': 1}
+                          for doc in contents if doc['_id'] not in clustered)
+        else:
+            clustered = set(_id for group in groups for _, _id in group['list'])
+            groups.extend({'_id': doc['_id'], 'opinion': doc['text'], 'list': [[doc['text'], doc['_id']]], 'num': 1}
+                          for doc in contents if doc['_id'] not in clustered)
+        logger.info('Merging %d groups from %d shards.' % (len(groups), shards))
+
+        # Second pass: cluster the shard-level groups by a representative text each.
+        if kind == 'cluster':
+            texts = dict((doc['_id'], doc['text']) for doc in contents)
+            representatives = [texts.get(group['_id'], texts[group['list'][0]]) for group in groups]
+        else:
+            representatives = [group['opinion'] for group in groups]
+        merged = []
+        if len(groups) > 1:
+            merge_task_id = task_id + 'merge' if task_id is not None else None
+            merged = self.cluster(list(enumerate(representatives)), merge_task_id, alpha, beta, timeout,
+                                  compact_ids=compact_ids)
+        merged_groups = [cluster['list'] for cluster in merged]
+        seen = set(i for indexes in merged_groups for i in indexes)
+        merged_groups.extend([i] for i in range(len(groups)) if i not in seen)
+
+        result = []
+        for indexes in merged_groups:
+            members = sorted((groups[i] for i in indexes), key=lambda group: -group['num'])
+            group = dict(members[0])
+            group['list'] = [item for member in members for item in member['list']]
+            group['num'] = len(group['list'])
+            if group['num'] > 1:
+                result.append(group)
+        result.sort(key=lambda group: -group['num'])
+        if kind == 'comments':
+            for i, group in enumerate(result):
+                group['_id'] = i
+        return result
+
+    def create_cluster_task(self, contents=None, task_id=None, simhash_distance=None, compact_ids=False):
         """创建 :py:class:`~bosonnlp.ClusterTask` 对象。
 
         :param contents: 需要做典型意见的文本序列或者 (_id, text) 序列或者
@@ -561,6 +1857,14 @@ class BosonNLP(object):
         :param string task_id: 默认为 :py:class:`None`，表示自动生成一个
             唯一的 task_id，典型意见任务的名字，可由字母和数字组成。
 
+        :param int simhash_distance: 默认为 :py:class:`None`，表示不做近似去重。
+            否则在上传前用 SimHash 合并指纹汉明距离不超过该值的近似重复文本，
+            只上传一条代表文本，结果中的 `list` 会展开回原来的 _id。
+
+        :param bool compact_ids: 默认为 False。为 True 时上传文本使用从 0 开始的整数 _id，
+            本地保存整数到原 _id 的对应关系，获取结果时再换回原来的 _id，
+            以减小上传和结果的数据量。多个客户端向同一个任务上传文本时不能使用。
+
         :raises:
 
             :py:exc:`~bosonnlp.HTTPError` - 如果 API 请求发生错误
@@ -569,17 +1873,18 @@ class BosonNLP(object):
 
         :returns: :py:class:`~bosonnlp.ClusterTask` 实例。
         """
-        return ClusterTask(self, contents, task_id)
+        return ClusterTask(self, contents, task_id, simhash_distance, compact_ids)
 
     def _comments_push(self, task_id, contents):
         api_endpoint = '/comments/push/' + task_id
         contents = CommentsTask._prepare_contents(contents)
         if not contents:
             return False
-        for i in range(0, len(contents), 100):
-            chunk = contents[i:i + 100]
-            r = self._api_request('POST', api_endpoint, data=chunk)
-            logger.info('Pushed %d of %d documents for comment clustering.' % (i+len(chunk), len(contents)))
+        pushed = 0
+        for chunk, body in _iter_chunks(contents, self.max_batch_size, self.max_batch_bytes):
+            r = self._api_request('POST', api_endpoint, body=body)
+            pushed += len(chunk)
+            logger.info('Pushed %d of %d documents for comment clustering.' % (pushed, len(contents)))
         return r.ok
 
     def _comments_analysis(self, task_id, alpha=None, beta=None):
@@ -615,12 +1920,13 @@ class BosonNLP(object):
         logger.info('%d comments fetched.' % len(v))
         return v
 
-    def _comments_clear(self, task_id):
+    def _comments_clear(self, task_id, **kwargs):
         api_endpoint = '/comments/clear/' + task_id
-        r = self._api_request('GET', api_endpoint)
+        r = self._api_request('GET', api_endpoint, **kwargs)
         return r.ok
 
-    def comments(self, contents, task_id=None, alpha=None, beta=None, timeout=DEFAULT_TIMEOUT):
+    def comments(self, contents, task_id=None, alpha=None, beta=None, timeout=DEFAULT_TIMEOUT,
+                 simhash_distance=None, shards=None, compact_ids=False):
         """BosonNLP `典型意见接口 <http://docs.bosonnlp.com/comments.html>`_ 封装。
 
         :param contents: 需要做典型意见的文本序列或者 (_id, text) 序列或者
@@ -638,6 +1944,19 @@ class BosonNLP(object):
 
         :param float timeout: 默认为 1800 秒（30 分钟），等待典型意见任务完成的秒数。
 
+        :param int simhash_distance: 默认为 :py:class:`None`，表示不做近似去重。
+            否则在上传前用 SimHash 合并指纹汉明距离不超过该值的近似重复文本，
+            只上传一条代表文本，结果中的 `list` 会展开回原来的 _id。
+
+        :param int shards: 默认为 :py:class:`None`。大于 1 时把文本分成 `shards` 份，
+            同时创建多个典型意见任务分别处理，再对各份结果的典型意见做一次文本聚类，
+            把相近的合并起来。适用于单个任务处理不了或太慢的大量文本。
+            某一份中未能成为 cluster 的文本也会参与合并，可以与其他份中的相近文本组成 cluster。
+
+        :param bool compact_ids: 默认为 False。为 True 时上传文本使用从 0 开始的整数 _id，
+            本地保存整数到原 _id 的对应关系，获取结果时再换回原来的 _id，
+            以减小上传和结果的数据量。多个客户端向同一个任务上传文本时不能使用。
+
         :returns: 接口返回的结果列表。
 
         :raises:
@@ -667,18 +1986,15 @@ class BosonNLP(object):
             return []
         if isinstance(contents[0], string_types):
             contents = [{"_id": _id, "text": s} for _id, s in enumerate(contents)]
-        comments = None
-        try:
-            comments = self.create_comments_task(contents, task_id)
+        if shards and shards > 1:
+            return self._sharded('comments', contents, shards, task_id, alpha, beta, timeout, simhash_distance,
+                                 compact_ids)
+        with self.create_comments_task(contents, task_id, simhash_distance, compact_ids) as comments:
             comments.analysis(alpha=alpha, beta=beta)
             comments.wait_until_complete(timeout)
-            result = comments.result()
-            return result
-        finally:
-            if comments is not None:
-                comments.clear()
+            return comments.result()
 
-    def create_comments_task(self, contents=None, task_id=None):
+    def create_comments_task(self, contents=None, task_id=None, simhash_distance=None, compact_ids=False):
         """创建 :py:class:`~bosonnlp.CommentsTask` 对象。
 
         :param contents: 需要做典型意见的文本序列或者 (_id, text) 序列或者
@@ -690,6 +2006,14 @@ class BosonNLP(object):
         :param string task_id: 默认为 :py:class:`None`，表示自动生成一个
             唯一的 task_id，典型意见任务的名字，可由字母和数字组成。
 
+        :param int simhash_distance: 默认为 :py:class:`None`，表示不做近似去重。
+            否则在上传前用 SimHash 合并指纹汉明距离不超过该值的近似重复文本，
+            只上传一条代表文本，结果中的 `list` 会展开回原来的 _id。
+
+        :param bool compact_ids: 默认为 False。为 True 时上传文本使用从 0 开始的整数 _id，
+            本地保存整数到原 _id 的对应关系，获取结果时再换回原来的 _id，
+            以减小上传和结果的数据量。多个客户端向同一个任务上传文本时不能使用。
+
         :raises:
 
             :py:exc:`~bosonnlp.HTTPError` - 如果 API 请求发生错误
@@ -698,17 +2022,30 @@ class BosonNLP(object):
 
         :returns: :py:class:`~bosonnlp.CommentsTask` 实例。
         """
-        return CommentsTask(self, contents, task_id)
+        return CommentsTask(self, contents, task_id, simhash_distance, compact_ids)
 
 
 class _ClusterTask(object):
 
-    def __init__(self, nlp, contents=None, task_id=None):
+    def __init__(self, nlp, contents=None, task_id=None, simhash_distance=None, compact_ids=False):
         if task_id is None:
             task_id = _generate_id()
 
         self.task_id = task_id
+        self._registry = nlp.task_registry
+        if self._registry is not None:
+            # Pin the task now so the registry knows which backend to clear it on.
+            self._registry.add(self._kind, task_id, nlp._pin_task(task_id))
         self._contents = []
+        # Representative _id -> _ids of the near-duplicate documents it stands for.
+        self._members = {}
+        self._simhash_index = None
+        if simhash_distance is not None:
+            self._simhash_index = _SimHashIndex(simhash_distance)
+        # With `compact_ids`, documents are pushed with _id i and self._ids[i] is their own _id.
+        self._ids = [] if compact_ids else None
+        # The result of the last `update`, to diff the next one against.
+        self._last_result = []
 
     @staticmethod
     def _prepare_contents(contents):
@@ -729,12 +2066,39 @@ class _ClusterTask(object):
         :type contents: sequence of string or sequence of (_id, text) or
             sequence of {'_id': _id, 'text': text}
 
+        如果创建任务时指定了 `simhash_distance`，近似重复的文本（包括与之前上传的文本
+        近似重复的）只上传第一条作为代表，获取结果时再展开为原来的 _id。
+
         :raises: :py:exc:`~bosonnlp.HTTPError` - 如果 API 请求发生错误
         """
         contents = self._prepare_contents(contents)
-        if self._push(contents):
+        pushed = contents
+        if self._simhash_index is not None:
+            pushed = self._collapse(pushed)
+        if self._ids is not None:
+            pushed = self._compact(pushed)
+        if not pushed or self._push(pushed):
             self._contents.extend(contents)
 
+    def _compact(self, contents):
+        start = len(self._ids)
+        self._ids.extend(doc['_id'] for doc in contents)
+        return [{'_id': start + i, 'text': doc['text']} for i, doc in enumerate(contents)]
+
+    def _collapse(self, contents):
+        representatives = []
+        for doc in contents:
+            fingerprint = _simhash(doc['text'])
+            rep = self._simhash_index.find(fingerprint)
+            if rep is None:
+                self._simhash_index.add(fingerprint, doc['_id'])
+                self._members[doc['_id']] = [doc['_id']]
+                representatives.append(doc)
+            else:
+                self._members[rep].append(doc['_id'])
+        logger.info('Collapsed %d documents into %d representatives.' % (len(contents), len(representatives)))
+        return representatives
+
     def analysis(self, alpha=None, beta=None):
         """启动分析任务
 
@@ -750,7 +2114,8 @@ class _ClusterTask(object):
         """等待任务完成。
 
         :param float timeout: 等待任务完成的秒数，默认为 :py:class:`None`，
-            表示不会超时。
+            表示不会超时。在 :py:meth:`~bosonnlp.BosonNLP.deadline` 中调用时，
+            最多等待到剩余的时间用完。
 
         :raises:
 
@@ -762,20 +2127,24 @@ class _ClusterTask(object):
 
             :py:exc:`~bosonnlp.TimeoutError` - 如果任务未能在 `timeout` 时间内完成。
         """
-        elapsed = 0.0
+        start = _monotonic()
+        timeout = timeout or None
+        remaining = _remaining()
+        if remaining is not None and (timeout is None or remaining < timeout):
+            timeout = max(remaining, 0.0)
         seconds_to_sleep = 1.0
-        if timeout is not None:
-            seconds_to_sleep = min(seconds_to_sleep, timeout)
         i = 0
         while True:
-            time.sleep(seconds_to_sleep)
+            if timeout is not None:
+                time.sleep(max(min(seconds_to_sleep, timeout - (_monotonic() - start)), 0.0))
+            else:
+                time.sleep(seconds_to_sleep)
 
             status = self.status()
             if status == "done":
                 return
 
-            elapsed += seconds_to_sleep
-            if timeout and elapsed >= timeout:
+            if timeout is not None and _monotonic() - start >= timeout:
                 raise TimeoutError('{0!r} timed out'.format(self))
 
             i = i + 1
@@ -814,7 +2183,12 @@ class _ClusterTask(object):
 
         :raises: :py:exc:`~bosonnlp.HTTPError` - 如果 API 请求发生错误
         """
-        return self._result()
+        result = self._result()
+        if self._ids is not None:
+            result = self._restore_ids(result)
+        if self._members:
+            result = self._expand(result)
+        return result
 
     def clear(self):
         """清空服务器端缓存的文本和结果。
@@ -823,7 +2197,103 @@ class _ClusterTask(object):
 
         :raises: :py:exc:`~bosonnlp.HTTPError` - 如果 API 请求发生错误
         """
-        return self._clear()
+        return self._clear_task()
+
+    def _clear_task(self, **kwargs):
+        ok = self._clear(**kwargs)
+        if ok and self._registry is not None:
+            self._registry.remove(self.task_id)
+        return ok
+
+    def update(self, contents=None, alpha=None, beta=None, timeout=DEFAULT_TIMEOUT):
+        """增量更新：上传新增的文本，重新分析，并与上一次 :py:meth:`update` 的结果比较。
+
+        之前上传的文本保留在服务器端，不需要重新上传。
+
+        :param contents: 新增的文本，格式与 :py:meth:`push` 一致。默认为 :py:class:`None`，
+            表示不上传新文本，只重新分析。
+
+        :param float alpha: 同 :py:meth:`analysis`。
+
+        :param float beta: 同 :py:meth:`analysis`。
+
+        :param float timeout: 默认为 1800 秒（30 分钟），等待任务完成的秒数。
+
+        :returns: ``(result, diff)``，`result` 为本次的结果，`diff` 为 dict：
+
+            ``new``
+                本次新出现的 cluster。
+            ``grown``
+                与上次对应、增加了文本的 cluster。
+            ``removed``
+                上次的结果中，本次没有对应的 cluster。
+            ``moved``
+                dict，上次已在某个 cluster 中、本次却被分到了不对应的 cluster 的文本，
+                ``{文本 _id: [上次 cluster 的 _id, 本次 cluster 的 _id 或 None]}``。
+
+            两次结果中的 cluster 按共有文本最多的原则一一对应，而不是按 cluster 的 _id。
+
+        :raises: 同 :py:meth:`wait_until_complete`。
+        """
+        if contents:
+            self.push(contents)
+        self.analysis(alpha=alpha, beta=beta)
+        self.wait_until_complete(timeout)
+        result = self.result()
+        diff = self._diff(self._last_result, result)
+        self._last_result = result
+        logger.info('%d new, %d grown and %d removed clusters, %d moved documents.' % (
+            len(diff['new']), len(diff['grown']), len(diff['removed']), len(diff['moved'])))
+        return result, diff
+
+    def _diff(self, previous, current):
+        previous_members = [set(self._member_ids(cluster)) for cluster in previous]
+        current_members = [set(self._member_ids(cluster)) for cluster in current]
+        overlaps = sorted(((len(p & c), i, j)
+                           for i, p in enumerate(previous_members)
+                           for j, c in enumerate(current_members) if not p.isdisjoint(c)),
+                          key=lambda overlap: -overlap[0])
+        # Match clusters greedily, the pairs sharing the most documents first.
+        match = {}
+        matched = set()
+        for _, i, j in overlaps:
+            if i not in match and j not in matched:
+                match[i] = j
+                matched.add(j)
+
+        where = {}
+        for j, members in enumerate(current_members):
+            for _id in members:
+                where[_id] = j
+        moved = {}
+        for i, members in enumerate(previous_members):
+            for _id in members:
+                j = where.get(_id)
+                if j is None or j != match.get(i):
+                    moved[_id] = [previous[i]['_id'], current[j]['_id'] if j is not None else None]
+
+        reverse = dict((j, i) for i, j in match.items())
+        return {
+            'new': [cluster for j, cluster in enumerate(current) if j not in reverse],
+            'grown': [cluster for j, cluster in enumerate(current)
+                      if j in reverse and current_members[j] - previous_members[reverse[j]]],
+            'removed': [cluster for i, cluster in enumerate(previous) if i not in match],
+            'moved': moved,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            # Clean up even if the caller's deadline has already run out.
+            with _deadline_scope(None):
+                self._clear_task(timeout=CLEAR_ON_EXIT_TIMEOUT)
+        except (HTTPError, TimeoutError, CircuitOpenError, requests.RequestException):
+            if exc_type is None:
+                raise
+            # Don't hide the error that made us leave the block.
+            logger.warning('Failed to clear %r.' % self, exc_info=True)
 
     def __repr__(self):
         return "<{0.__class__.__name__} {0.task_id}>".format(self)
@@ -871,11 +2341,25 @@ class ClusterTask(_ClusterTask):
     >>> cluster.clear()
     True
 
+    也可以把任务作为上下文管理器使用，退出时（包括发生异常时）自动清空。
+
+    >>> with nlp.create_cluster_task(contents) as cluster:
+    ...     cluster.analysis()
+    ...     cluster.wait_until_complete()
+    ...     result = cluster.result()
+
+    对持续增加的文本，可以保留任务，用 :py:meth:`~bosonnlp.ClusterTask.update`
+    只上传新增的文本并重新分析，得到与上次结果的差异。
+
+    >>> result, diff = cluster.update(new_contents)
+
     :param nlp: :py:class:`~bosonnlp.BosonNLP` 类实例。
         其他参数和 :py:meth:`~bosonnlp.BosonNLP.cluster` 一致。
     """
-    def __init__(self, nlp, contents=None, task_id=None):
-        super(ClusterTask, self).__init__(nlp, contents, task_id)
+    _kind = 'cluster'
+
+    def __init__(self, nlp, contents=None, task_id=None, simhash_distance=None, compact_ids=False):
+        super(ClusterTask, self).__init__(nlp, contents, task_id, simhash_distance, compact_ids)
 
         self._push = partial(nlp._cluster_push, self.task_id)
         self._analysis = partial(nlp._cluster_analysis, self.task_id)
@@ -883,7 +2367,36 @@ class ClusterTask(_ClusterTask):
         self._result = partial(nlp._cluster_result, self.task_id)
         self._clear = partial(nlp._cluster_clear, self.task_id)
 
-        self.push(contents)
+        try:
+            self.push(contents)
+        except Exception:
+            # The caller never gets the task, so it can't clear it.
+            self.__exit__(*sys.exc_info())
+            raise
+
+    @staticmethod
+    def _member_ids(cluster):
+        return cluster['list']
+
+    def _restore_ids(self, result):
+        ids = self._ids
+        for cluster in result:
+            cluster['_id'] = ids[cluster['_id']]
+            cluster['list'] = [ids[i] for i in cluster['list']]
+        return result
+
+    def _expand(self, result):
+        clustered = set()
+        for cluster in result:
+            clustered.update(cluster['list'])
+            cluster['list'] = [_id for rep in cluster['list'] for _id in self._members.get(rep, [rep])]
+            cluster['num'] = len(cluster['list'])
+        # A group of near-duplicates is a cluster on its own, even if the
+        # server never saw more than its representative.
+        for rep, members in self._members.items():
+            if rep not in clustered and len(members) > 1:
+                result.append({'_id': rep, 'list': list(members), 'num': len(members)})
+        return result
 
 
 class CommentsTask(_ClusterTask):
@@ -944,11 +2457,15 @@ class CommentsTask(_ClusterTask):
     >>> comments.clear()
     True
 
+    也可以把任务作为上下文管理器使用，退出时（包括发生异常时）自动清空。
+
     :param nlp: :py:class:`~bosonnlp.BosonNLP` 类实例。
         其他参数和 :py:meth:`~bosonnlp.BosonNLP.comments` 一致。
     """
-    def __init__(self, nlp, contents=None, task_id=None):
-        super(CommentsTask, self).__init__(nlp, contents, task_id)
+    _kind = 'comments'
+
+    def __init__(self, nlp, contents=None, task_id=None, simhash_distance=None, compact_ids=False):
+        super(CommentsTask, self).__init__(nlp, contents, task_id, simhash_distance, compact_ids)
 
         self._push = partial(nlp._comments_push, self.task_id)
         self._analysis = partial(nlp._comments_analysis, self.task_id)
@@ -956,7 +2473,29 @@ class CommentsTask(_ClusterTask):
         self._result = partial(nlp._comments_result, self.task_id)
         self._clear = partial(nlp._comments_clear, self.task_id)
 
-        self.push(contents)
+        try:
+            self.push(contents)
+        except Exception:
+            # The caller never gets the task, so it can't clear it.
+            self.__exit__(*sys.exc_info())
+            raise
+
+    @staticmethod
+    def _member_ids(opinion):
+        return [_id for _, _id in opinion['list']]
+
+    def _restore_ids(self, result):
+        ids = self._ids
+        for opinion in result:
+            opinion['list'] = [[text, ids[i]] for text, i in opinion['list']]
+        return result
+
+    def _expand(self, result):
+        for opinion in result:
+            opinion['list'] = [[text, _id] for text, rep in opinion['list']
+                               for _id in self._members.get(rep, [rep])]
+            opinion['num'] = len(opinion['list'])
+        return result
 
 
 if __name__ == '__main__':
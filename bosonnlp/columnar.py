@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""把 :py:meth:`~bosonnlp.BosonNLP.tag`、:py:meth:`~bosonnlp.BosonNLP.ner` 和
+:py:meth:`~bosonnlp.BosonNLP.depparser` 的批量结果转换为列式数组。
+
+转换后所有文本的词被拼接成一条序列，后续的特征处理可以直接在数组上做向量化
+计算，而不需要逐个处理 Python 对象。
+
+需要安装 `NumPy`_，转换为 Arrow 还需要安装 `PyArrow`_::
+
+    $ pip install bosonnlp[numpy]
+    $ pip install bosonnlp[arrow]
+
+.. _NumPy: http://www.numpy.org/
+.. _PyArrow: https://arrow.apache.org/docs/python/
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from itertools import chain
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('bosonnlp.columnar requires NumPy, install it with `pip install bosonnlp[numpy]`')
+    return numpy
+
+
+def _intern(np, values):
+    """Return ``(ids, vocabulary)`` with ``vocabulary[ids[i]] == values[i]``."""
+    vocabulary, ids = np.unique(np.array(values, dtype='U'), return_inverse=True)
+    return ids.astype(np.int32), vocabulary.tolist()
+
+
+def to_numpy(results):
+    """把结果列表转换为 NumPy 数组。
+
+    :param results: :py:meth:`~bosonnlp.BosonNLP.tag`、:py:meth:`~bosonnlp.BosonNLP.ner`
+        或 :py:meth:`~bosonnlp.BosonNLP.depparser` 返回的结果列表。
+
+    :returns: dict，包含以下数组（仅当结果中有对应字段时才会包含相应的项）：
+
+        ``word_offsets``
+            int64，长度为文本数 + 1，第 i 篇文本的词为
+            ``words[word_offsets[i]:word_offsets[i + 1]]``。
+        ``words``
+            所有词拼接成的 unicode 数组。
+        ``tag_ids``, ``tags``
+            int32 的词性序号，以及词性表。
+        ``heads``
+            int32，中心词在整个词序列中的位置，根节点为 -1。
+        ``entity_offsets``
+            int64，长度为文本数 + 1，第 i 篇文本的实体为
+            ``entity_offsets[i]:entity_offsets[i + 1]``。
+        ``entity_spans``
+            int32，形状为 (实体数, 2)，实体在整个词序列中的 [起始, 结束) 位置。
+        ``entity_type_ids``, ``entity_types``
+            int32 的实体类型序号，以及实体类型表。
+
+    调用示例：
+
+    >>> from bosonnlp.columnar import to_numpy
+    >>> arrays = to_numpy(nlp.ner(['成都商报记者 姚永忠', '微软XP操作系统今日正式退休']))
+    >>> arrays['word_offsets']
+    array([ 0,  4, 10])
+    >>> arrays['entity_spans']
+    array([[0, 2], [2, 3], [3, 4], [4, 6], [7, 8]], dtype=int32)
+    """
+    np = _import_numpy()
+    if not results:
+        return {'word_offsets': np.zeros(1, dtype=np.int64), 'words': np.array([], dtype='U')}
+
+    lengths = np.array([len(result['word']) for result in results], dtype=np.int64)
+    word_offsets = np.concatenate([[0], np.cumsum(lengths)])
+    arrays = {
+        'word_offsets': word_offsets,
+        'words': np.array(list(chain.from_iterable(result['word'] for result in results)), dtype='U'),
+    }
+    starts = np.repeat(word_offsets[:-1], lengths)
+
+    if 'tag' in results[0]:
+        arrays['tag_ids'], arrays['tags'] = _intern(
+            np, list(chain.from_iterable(result['tag'] for result in results)))
+
+    if 'head' in results[0]:
+        heads = np.fromiter(chain.from_iterable(result['head'] for result in results),
+                            dtype=np.int32, count=len(starts))
+        arrays['heads'] = np.where(heads >= 0, heads + starts, -1).astype(np.int32)
+
+    if 'entity' in results[0]:
+        counts = np.array([len(result['entity']) for result in results], dtype=np.int64)
+        entities = list(chain.from_iterable(result['entity'] for result in results))
+        spans = np.array([entity[:2] for entity in entities], dtype=np.int32).reshape(-1, 2)
+        arrays['entity_offsets'] = np.concatenate([[0], np.cumsum(counts)])
+        arrays['entity_spans'] = spans + np.repeat(word_offsets[:-1], counts).astype(np.int32)[:, None]
+        arrays['entity_type_ids'], arrays['entity_types'] = _intern(np, [entity[2] for entity in entities])
+
+    return arrays
+
+
+def to_arrow(results):
+    """把结果列表转换为 :py:class:`pyarrow.Table`，每篇文本一行。
+
+    ``word`` 为 ``list<string>`` 列，``tag`` 和 ``entity_type`` 为字典编码的列表列，
+    ``head``、``entity_start`` 和 ``entity_end`` 为 ``list<int32>`` 列。与
+    :py:func:`to_numpy` 不同，这些位置是文本内的词序号，与接口返回的结果一致。
+    所有列表列共享 :py:func:`to_numpy` 计算出的偏移量，不会逐行构造 Python 对象。
+
+    :param results: 与 :py:func:`to_numpy` 一致。
+
+    :returns: :py:class:`pyarrow.Table`
+    """
+    np = _import_numpy()
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError('bosonnlp.columnar.to_arrow requires PyArrow, '
+                          'install it with `pip install bosonnlp[arrow]`')
+
+    arrays = to_numpy(results)
+    word_offsets = pa.array(arrays['word_offsets'].astype(np.int32))
+    starts = np.repeat(arrays['word_offsets'][:-1], np.diff(arrays['word_offsets'])).astype(np.int32)
+
+    def lists(offsets, values):
+        return pa.ListArray.from_arrays(offsets, values)
+
+    columns = {'word': lists(word_offsets, pa.array(arrays['words'], type=pa.string()))}
+    if 'tag_ids' in arrays:
+        columns['tag'] = lists(word_offsets, pa.DictionaryArray.from_arrays(
+            pa.array(arrays['tag_ids']), pa.array(arrays['tags'], type=pa.string())))
+    if 'heads' in arrays:
+        heads = arrays['heads']
+        columns['head'] = lists(word_offsets, pa.array(np.where(heads >= 0, heads - starts, -1).astype(np.int32)))
+    if 'entity_spans' in arrays:
+        entity_offsets = pa.array(arrays['entity_offsets'].astype(np.int32))
+        counts = np.diff(arrays['entity_offsets'])
+        spans = arrays['entity_spans'] - np.repeat(arrays['word_offsets'][:-1], counts).astype(np.int32)[:, None]
+        columns['entity_start'] = lists(entity_offsets, pa.array(spans[:, 0]))
+        columns['entity_end'] = lists(entity_offsets, pa.array(spans[:, 1]))
+        columns['entity_type'] = lists(entity_offsets, pa.DictionaryArray.from_arrays(
+            pa.array(arrays['entity_type_ids']), pa.array(arrays['entity_types'], type=pa.string())))
+    names = sorted(columns)
+    return pa.Table.from_arrays([columns[name] for name in names], names=names)
@@ -14,3 +14,16 @@ class TaskError(HTTPError):
 
 class TimeoutError(Exception):
     """分析任务超时。"""
+
+
+class CircuitOpenError(Exception):
+    """接口熔断中，请求没有发送。
+
+    .. attribute:: endpoint
+
+       熔断的接口，如 ``/ner/analysis``。
+    """
+
+    def __init__(self, message, endpoint=None):
+        super(CircuitOpenError, self).__init__(message)
+        self.endpoint = endpoint
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""带流量控制的批量处理流水线。
+
+:py:class:`Pipeline` 从迭代器或者队列中读取文本，组成批次后并发调用接口，
+同时限制正在处理的批次数、请求速率，并重试临时错误。结果按输入顺序产生。
+上游（如 Kafka 消费者）最多被预读 `read_ahead` 批，不会因为接口处理不过来而占满内存。
+
+    >>> import os
+    >>> from bosonnlp import BosonNLP
+    >>> from bosonnlp.pipeline import Pipeline
+    >>> nlp = BosonNLP(os.environ['BOSON_API_TOKEN'], thread_safe=True)
+    >>> pipeline = Pipeline(nlp, 'sentiment', consumer, max_in_flight=4, rate_limit=10)
+    >>> for result in pipeline:
+    ...     handle(result)
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import time
+import threading
+from itertools import islice
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+from requests.exceptions import ConnectionError, Timeout
+
+from .client import _imap_bounded, _call_with_deadline, _get_deadline, _remaining, queue
+from .exceptions import HTTPError
+
+
+def _is_retryable(error):
+    if isinstance(error, (ConnectionError, Timeout)):
+        return True
+    response = getattr(error, 'response', None)
+    return response is None or response.status_code == 429 or response.status_code >= 500
+
+
+class _RateLimiter(object):
+    """Space out calls to `acquire` to at most ``rate`` per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.time()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Pipeline(object):
+    """批量处理流水线。
+
+    :param nlp: :py:class:`~bosonnlp.BosonNLP` 类实例，建议启用 `thread_safe`。
+
+    :param string endpoint: 支持批量调用的接口名，如 ``sentiment``、``tag``。
+
+    :param source: 文本的来源，可以是任意可迭代对象，也可以是 :py:class:`queue.Queue`，
+        从队列中读到 :py:class:`None` 时结束。
+
+    :param int batch_size: 每批文本数，默认为 100。
+
+    :param int max_in_flight: 最多同时处理的批次数，默认为 4。
+
+    :param int read_ahead: 最多预读、等待处理的批次数，默认为 :py:class:`None`，即与
+        `max_in_flight` 相同。这些批次计入 :py:attr:`queue_depth`。设置为 0 时只在有空闲时
+        读取来源，:py:attr:`queue_depth` 始终为 0，可以用 :py:attr:`in_flight` 达到
+        `max_in_flight` 判断流水线已经饱和。
+
+    :param int retries: 连接错误、超时、429 及 5xx 错误的最多重试次数，默认为 3。
+
+    :param float backoff: 第一次重试前等待的秒数，之后每次重试加倍，默认为 1 秒。
+
+    :param float rate_limit: 每秒最多发送的请求数，默认为 :py:class:`None`，表示不限制。
+
+    :param sink: 默认为 :py:class:`None`。:py:meth:`run` 写入结果的
+        :py:class:`~bosonnlp.sinks.Sink`。
+
+    其他关键字参数会原样传给 `endpoint` 方法。
+
+    遍历 :py:class:`Pipeline` 实例按输入顺序产生每篇文本的结果，
+    重试后仍然失败时抛出对应的异常。在 :py:meth:`~bosonnlp.BosonNLP.deadline` 中遍历时，
+    所有请求都受剩余时间限制，剩余时间不够重试前的等待时不再重试。
+    """
+
+    def __init__(self, nlp, endpoint, source, batch_size=100, max_in_flight=4, retries=3, backoff=1.0,
+                 rate_limit=None, sink=None, read_ahead=None, **kwargs):
+        self.nlp = nlp
+        self.endpoint = endpoint
+        self.source = source
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.read_ahead = max_in_flight if read_ahead is None else read_ahead
+        self.retries = retries
+        self.backoff = backoff
+        self.sink = sink
+        self.kwargs = kwargs
+        self._rate_limiter = _RateLimiter(rate_limit) if rate_limit else None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._processed = 0
+        self._retried = 0
+
+    @property
+    def queue_depth(self):
+        """已从来源读取、等待空闲线程发送的批次数，最多为 `read_ahead`。"""
+        return self._queued
+
+    @property
+    def in_flight(self):
+        """正在请求中的批次数。"""
+        return self._in_flight
+
+    def stats(self):
+        """返回流水线的运行状态，可用于监控和自动扩缩容。
+
+        :returns: dict，包含 ``queue_depth``、``in_flight``、``processed``（已处理的文本数）、
+            ``retries``（重试次数）；如果来源是队列，还包含 ``source_depth``（队列长度）。
+        """
+        with self._lock:
+            stats = {
+                'queue_depth': self._queued,
+                'in_flight': self._in_flight,
+                'processed': self._processed,
+                'retries': self._retried,
+            }
+        if isinstance(self.source, queue.Queue):
+            stats['source_depth'] = self.source.qsize()
+        return stats
+
+    def _batches(self):
+        source = self.source
+        if isinstance(source, queue.Queue):
+            source = iter(source.get, None)
+        it = iter(source)
+        while True:
+            batch = list(islice(it, self.batch_size))
+            if not batch:
+                return
+            with self._lock:
+                self._queued += 1
+            yield batch
+
+    def _process(self, batch):
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+        try:
+            results = self._call(batch)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        with self._lock:
+            self._processed += len(batch)
+        return results
+
+    def _call(self, batch):
+        method = getattr(self.nlp, self.endpoint)
+        attempt = 0
+        while True:
+            if self._rate_limiter is not None:
+                self._rate_limiter.acquire()
+            try:
+                return method(batch, **self.kwargs)
+            except (HTTPError, ConnectionError, Timeout) as e:
+                if attempt >= self.retries or not _is_retryable(e):
+                    raise
+                backoff = self.backoff * 2 ** attempt
+                remaining = _remaining()
+                if remaining is not None and remaining <= backoff:
+                    raise
+                with self._lock:
+                    self._retried += 1
+                time.sleep(backoff)
+                attempt += 1
+
+    def __iter__(self):
+        # Batches are processed under the deadline of the iterating thread.
+        process = partial(_call_with_deadline, _get_deadline(), self._process)
+        pool = ThreadPool(self.max_in_flight)
+        try:
+            max_pending = self.max_in_flight + self.read_ahead
+            for results in _imap_bounded(pool, process, self._batches(), max_pending):
+                for result in results:
+                    yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def run(self, sink=None):
+        """处理所有文本，并把结果依次写入 `sink`。
+
+        :param sink: 默认为 :py:class:`None`，即使用创建时传入的 `sink`。
+
+        :returns: 写入的结果数。
+        """
+        sink = sink if sink is not None else self.sink
+        if sink is None:
+            raise ValueError('Pipeline.run needs a sink, pass one to Pipeline() or run()')
+        count = 0
+        for index, result in enumerate(self):
+            sink.write(index, result)
+            count += 1
+        return count
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""记录创建过的文本聚类和典型意见任务，清理被遗弃的任务。
+
+进程在创建任务之后、调用 :py:meth:`~bosonnlp.ClusterTask.clear` 之前崩溃时，
+服务器端会一直缓存上传的文本和结果。把 :py:class:`TaskRegistry` 传给
+:py:class:`~bosonnlp.BosonNLP` 后，创建的任务会记录到本地文件中，清空后从中删除；
+下次启动时调用 :py:meth:`TaskRegistry.sweep` 即可批量清空遗留的任务。
+
+    >>> import os
+    >>> from bosonnlp import BosonNLP
+    >>> from bosonnlp.registry import TaskRegistry
+    >>> registry = TaskRegistry('bosonnlp-tasks.json')
+    >>> nlp = BosonNLP(os.environ['BOSON_API_TOKEN'], task_registry=registry)
+    >>> registry.sweep(nlp)
+    ['9e90c56e-f1bb-4605-b995-304af733207a']
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import io
+import os
+import json
+import time
+import logging
+import threading
+
+from .client import DEFAULT_TIMEOUT, DEFAULT_WORKERS, _thread_imap, text_type, _json_dumps
+
+
+logger = logging.getLogger(__name__)
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+class TaskRegistry(object):
+    """保存在 JSON 文件中的任务记录。
+
+    同一个文件不应被多个同时运行的进程使用。
+
+    :param string path: 文件路径。文件不存在时会在第一次记录任务时创建。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._tasks = {}
+        if os.path.exists(path):
+            with io.open(path, encoding='utf-8') as f:
+                self._tasks = json.load(f)
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        with io.open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text_type(_json_dumps(self._tasks)))
+        _replace(tmp, self.path)
+
+    def add(self, kind, task_id, backend=None):
+        """记录新创建的任务。
+
+        :param string kind: ``'cluster'`` 或 ``'comments'``。
+
+        :param string task_id: 任务的 task_id。
+
+        :param int backend: 默认为 :py:class:`None`。配置了多个后端时，创建任务的后端序号。
+        """
+        with self._lock:
+            self._tasks[task_id] = {'kind': kind, 'created': time.time(), 'backend': backend}
+            self._save()
+
+    def remove(self, task_id):
+        """删除任务的记录。"""
+        with self._lock:
+            if self._tasks.pop(task_id, None) is not None:
+                self._save()
+
+    def tasks(self):
+        """返回所有记录的任务。
+
+        :returns: 列表，每项为 ``{'task_id': task_id, 'kind': kind, 'created': 创建时的时间戳,
+            'backend': 后端序号}``。
+        """
+        with self._lock:
+            return [dict(task, task_id=task_id) for task_id, task in self._tasks.items()]
+
+    def sweep(self, nlp, older_than=DEFAULT_TIMEOUT, workers=DEFAULT_WORKERS):
+        """并发清空创建时间早于 `older_than` 秒之前的任务，并删除它们的记录。
+
+        :param nlp: 用于清空任务的 :py:class:`~bosonnlp.BosonNLP` 实例。配置了多个后端时，
+            每个任务都发送到创建它的后端，因此 `backends` 应与创建任务时相同。
+
+        :param float older_than: 默认为 1800 秒（30 分钟），与
+            :py:meth:`~bosonnlp.BosonNLP.cluster` 等待任务的默认时间一致。
+            设置为 0 表示清空所有记录的任务。
+
+        :param int workers: 同时发送的请求数，默认为 8。
+
+        :returns: 成功清空的 task_id 列表。清空失败的任务会保留记录，留待下次清理。
+        """
+        cutoff = time.time() - older_than
+        tasks = [task for task in self.tasks() if task['created'] <= cutoff]
+
+        def clear(task):
+            if task.get('backend') is not None:
+                nlp._pin_task(task['task_id'], task['backend'])
+            return getattr(nlp, '_{0}_clear'.format(task['kind']))(task['task_id'])
+
+        cleared = []
+        for task, ok in zip(tasks, _thread_imap(clear, tasks, workers)):
+            if ok is True:
+                self.remove(task['task_id'])
+                cleared.append(task['task_id'])
+            else:
+                logger.warning('Failed to clear %s task %s: %r' % (task['kind'], task['task_id'], ok))
+        logger.info('Cleared %d of %d abandoned tasks.' % (len(cleared), len(tasks)))
+        return cleared
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""录制 API 请求和响应，之后离线回放。
+
+:py:func:`record` 把 :py:class:`~bosonnlp.BosonNLP` 发出的每个请求及其响应写入本地文件，
+:py:func:`replay` 则直接从文件中读取响应，不再访问网络，也不消耗 API 调用次数。
+可以用来离线测试数据处理流程，或者稳定地测量客户端本身的开销。
+
+请求按方法、路径、查询参数以及（解压后的）请求体的 SHA-1 识别，不包括 API Token
+和服务器地址。同一个请求录制到多个响应时（例如轮询任务状态），回放时依次返回，
+用完后重复返回最后一个。
+上传文本聚类或典型意见的文本时如果没有指定 _id，每次自动生成的 _id 都不同，
+这样的请求无法回放。
+
+    >>> import os
+    >>> from bosonnlp import BosonNLP
+    >>> from bosonnlp import replay
+    >>> nlp = BosonNLP(os.environ['BOSON_API_TOKEN'])
+    >>> with replay.record(nlp, 'bosonnlp.jsonl'):
+    ...     nlp.tag(texts)
+    >>> nlp = BosonNLP('', bosonnlp_url='http://offline')
+    >>> with replay.replay(nlp, 'bosonnlp.jsonl'):
+    ...     nlp.tag(texts)
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import io
+import os
+import json
+import gzip
+import hashlib
+import threading
+from io import BytesIO
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from .client import text_type, _json_dumps
+
+try:
+    from urllib.parse import urlsplit, parse_qsl, urlencode
+except ImportError:
+    from urlparse import urlsplit, parse_qsl
+    from urllib import urlencode
+
+
+class RecordingNotFoundError(LookupError):
+    """回放时没有找到请求对应的录制。"""
+
+
+def _request_key(request):
+    url = urlsplit(request.url)
+    query = urlencode(sorted(parse_qsl(url.query, keep_blank_values=True)))
+    body = request.body or b''
+    if isinstance(body, text_type):
+        body = body.encode('utf-8')
+    body = memoryview(body).tobytes()
+    if request.headers.get('Content-Encoding') == 'gzip':
+        # The gzip header holds a timestamp, so hash the content instead.
+        body = gzip.GzipFile(fileobj=BytesIO(body)).read()
+    return '{0} {1}?{2} {3}'.format(request.method, url.path, query, hashlib.sha1(body).hexdigest())
+
+
+class Recording(object):
+    """录制文件，每行一个 JSON，记录一个请求的响应。
+
+    一般通过 :py:func:`record` 或 :py:func:`replay` 创建。可以作为上下文管理器使用，
+    退出时调用 :py:meth:`close`。
+
+    :param string path: 文件路径。文件已存在时读入其中的录制，新的录制追加到文件末尾。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # key -> [recorded responses, how many of them were replayed]
+        self._responses = {}
+        self._file = None
+        # The session's adapters, and the ones to put back on `close`.
+        self._adapters = None
+        self._saved = None
+        if os.path.exists(path):
+            with io.open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._responses.setdefault(entry['key'], [[], 0])[0].append(entry)
+
+    def __len__(self):
+        return sum(len(responses) for responses, _ in self._responses.values())
+
+    def add(self, key, response):
+        entry = {
+            'key': key,
+            'status': response.status_code,
+            'reason': response.reason,
+            'content_type': response.headers.get('Content-Type'),
+            'body': response.content.decode('utf-8'),
+        }
+        with self._lock:
+            if self._file is None:
+                self._file = io.open(self.path, 'a', encoding='utf-8')
+            self._file.write(text_type(_json_dumps(entry)))
+            self._file.write('\n')
+            self._file.flush()
+            self._responses.setdefault(key, [[], 0])[0].append(entry)
+
+    def response_for(self, key):
+        with self._lock:
+            recorded = self._responses.get(key)
+            if recorded is None:
+                return None
+            responses, replayed = recorded
+            recorded[1] = replayed + 1
+            return responses[min(replayed, len(responses) - 1)]
+
+    def _mount(self, session, make_adapter):
+        # Thread-safe clones of the session share this dict, so they switch too.
+        self._adapters = session.adapters
+        self._saved = dict(session.adapters)
+        for prefix in ('http://', 'https://'):
+            session.adapters[prefix] = make_adapter(self._saved[prefix])
+
+    def close(self):
+        """恢复原来的连接方式，并关闭录制文件。"""
+        if self._adapters is not None:
+            self._adapters.update(self._saved)
+            self._adapters = None
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _RecordAdapter(BaseAdapter):
+
+    def __init__(self, recording, adapter):
+        super(_RecordAdapter, self).__init__()
+        self.recording = recording
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        response = self.adapter.send(request, **kwargs)
+        self.recording.add(_request_key(request), response)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+class _ReplayAdapter(BaseAdapter):
+
+    def __init__(self, recording):
+        super(_ReplayAdapter, self).__init__()
+        self.recording = recording
+
+    def send(self, request, **kwargs):
+        key = _request_key(request)
+        entry = self.recording.response_for(key)
+        if entry is None:
+            raise RecordingNotFoundError('no recorded response for {0}'.format(key))
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = entry['reason']
+        response.headers = CaseInsensitiveDict({'Content-Type': entry['content_type'] or 'application/json'})
+        response._content = entry['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+def record(nlp, path):
+    """录制 `nlp` 之后发出的所有请求的响应。
+
+    :param nlp: :py:class:`~bosonnlp.BosonNLP` 实例。线程安全模式下所有线程的请求都会被录制。
+
+    :param string path: 录制文件的路径，已存在时追加。
+
+    :returns: :py:class:`Recording`，调用其 :py:meth:`~Recording.close` 停止录制。
+    """
+    recording = Recording(path)
+    recording._mount(nlp._session, lambda adapter: _RecordAdapter(recording, adapter))
+    return recording
+
+
+def replay(nlp, path):
+    """让 `nlp` 之后的所有请求都从录制文件中返回响应，不访问网络。
+
+    :param nlp: :py:class:`~bosonnlp.BosonNLP` 实例。
+
+    :param string path: :py:func:`record` 写入的录制文件路径。
+
+    :returns: :py:class:`Recording`，调用其 :py:meth:`~Recording.close` 停止回放。
+
+    没有录制的请求会抛出 :py:exc:`RecordingNotFoundError`。
+    """
+    recording = Recording(path)
+    recording._mount(nlp._session, lambda adapter: _ReplayAdapter(recording))
+    return recording
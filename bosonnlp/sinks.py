@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""批量处理结果的输出。
+
+:py:func:`bosonnlp.bulk.run`、:py:meth:`bosonnlp.BosonNLP.tag` 等批量调用可以把每批结果一返回就写入输出，
+而不是在内存中保留全部结果。所有输出都可以作为上下文管理器使用，退出时自动关闭。
+
+    >>> from bosonnlp import bulk
+    >>> from bosonnlp.sinks import JSONLSink
+    >>> with JSONLSink('tags.jsonl') as sink:
+    ...     bulk.run('tag', texts, os.environ['BOSON_API_TOKEN'], sink=sink)
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import io
+
+from .client import _json_dumps, text_type, string_types
+
+
+class Sink(object):
+    """结果输出的基类。子类需要实现 :py:meth:`write`。"""
+
+    def write(self, index, result):
+        """写入一条结果。
+
+        :param int index: 结果对应的输入在所有输入中的序号。
+
+        :param result: 接口返回的结果。
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """写入所有缓冲的结果并释放资源。"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CallbackSink(Sink):
+    """对每条结果调用 ``callback(index, result)``。"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, index, result):
+        self.callback(index, result)
+
+
+class JSONLSink(Sink):
+    """把结果以每行一个 JSON 的格式写入文件。
+
+    :param file: 文件路径，或者已打开的文本文件对象。
+
+    :param bool with_index: 默认为 False，每行只写入结果；为 True 时每行写入
+        ``{"index": 序号, "result": 结果}``，适用于乱序输出的结果。
+    """
+
+    def __init__(self, file, with_index=False):
+        self._owns_file = isinstance(file, string_types)
+        self._file = io.open(file, 'w', encoding='utf-8') if self._owns_file else file
+        self.with_index = with_index
+
+    def write(self, index, result):
+        record = {'index': index, 'result': result} if self.with_index else result
+        self._file.write(text_type(_json_dumps(record)))
+        self._file.write('\n')
+
+    def close(self):
+        if self._owns_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+
+class ParquetSink(Sink):
+    """把结果写入 Parquet 文件，每行包含 ``index`` 和 ``result`` 两列，
+    ``result`` 的类型由第一批结果推断。需要安装 `PyArrow`_。
+
+    :param string path: 文件路径。
+
+    :param int batch_size: 每缓冲多少条结果写入一个 row group，默认为 10000。
+
+    .. _PyArrow: https://arrow.apache.org/docs/python/
+    """
+
+    def __init__(self, path, batch_size=10000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('ParquetSink requires PyArrow, install it with `pip install bosonnlp[arrow]`')
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        self.batch_size = batch_size
+        self._rows = []
+        self._writer = None
+
+    def write(self, index, result):
+        self._rows.append({'index': index, 'result': result})
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """把缓冲的结果写入一个 row group。"""
+        if not self._rows:
+            return
+        schema = self._writer.schema if self._writer is not None else None
+        table = self._pa.Table.from_pylist(self._rows, schema=schema)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+        self._rows = []
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
@@ -16,6 +16,10 @@ setup(
     install_requires=[
         'requests>=2.0.0',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+        'arrow': ['numpy', 'pyarrow'],
+    },
     tests_require=[
         'pytest',
     ],
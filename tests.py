@@ -2,6 +2,14 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import os
+import sys
+import subprocess
+import gzip
+import json
+import time
+import threading
+from io import BytesIO
+
 import pytest
 from bosonnlp import BosonNLP, ClusterTask, CommentsTask
 from bosonnlp.exceptions import HTTPError, TimeoutError
@@ -51,10 +59,14 @@ def test_compress_request_body_larger_than_10k(nlp):
 
 def test_exceed_maximum_size_of_100_raises_HTTPError(nlp):
     input = ['今天天气好'] * 101
-    excinfo = pytest.raises(HTTPError, lambda: nlp.sentiment(input))
+    excinfo = pytest.raises(HTTPError, lambda: nlp._api_request('POST', '/sentiment/analysis', data=input))
     assert excinfo.value.response.status_code == 413
 
 
+def test_batch_larger_than_100_is_split(nlp):
+    assert len(nlp.sentiment(['今天天气好'] * 101)) == 101
+
+
 def test_classify(nlp):
     assert nlp.classify('俄否决安理会谴责叙军战机空袭阿勒颇平民') == [5]
     assert nlp.classify(['俄否决安理会谴责叙军战机空袭阿勒颇平民',
@@ -332,3 +344,1022 @@ def test_custom_requests_session():
     result = nlp.sentiment(['再也不来了', '美好的世界'])
     assert result[0][1] > result[0][0]
     assert result[1][0] > result[1][1]
+
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+
+class FakeBosonNLPHandler(BaseHTTPRequestHandler):
+    """本地模拟的 BosonNLP HTTP API，用于不依赖网络和 API token 的测试。"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        server = self.server
+        url = urlparse(self.path)
+        params = dict((k, v[0]) for k, v in parse_qs(url.query, keep_blank_values=True).items())
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=BytesIO(body)).read()
+        data = json.loads(body.decode('utf-8')) if body else None
+        with server.lock:
+            server.requests.append({
+                'method': method,
+                'path': url.path,
+                'params': params,
+                'data': data,
+                'body': body,
+                'token': self.headers.get('X-Token'),
+                'content_encoding': self.headers.get('Content-Encoding'),
+            })
+        if server.delay:
+            with server.lock:
+                delay = server.delay_times is None or server.delay_times > 0
+                if server.delay_times:
+                    server.delay_times -= 1
+            if delay:
+                time.sleep(server.delay)
+        if self.headers.get('X-Token') in server.exhausted_tokens:
+            return self._reply(429, {'message': 'count limit exceeded'})
+        if server.fail_with:
+            with server.lock:
+                fail = server.fail_times is None or server.fail_times > 0
+                if server.fail_times:
+                    server.fail_times -= 1
+            if fail:
+                return self._reply(server.fail_with, {'message': 'fake failure'})
+
+        parts = url.path.strip('/').split('/')
+        handler = getattr(self, 'api_' + parts[0], None)
+        if handler is None:
+            return self._reply(404, {'message': 'not found'})
+        texts = [data] if not isinstance(data, list) else data
+        if parts[-1] == 'analysis' and method == 'POST' and len(texts) > 100:
+            return self._reply(413, {'message': 'too many documents'})
+        self._reply(200, handler(parts[1:], params, texts))
+
+    def api_sentiment(self, parts, params, texts):
+        return [[len(t) % 10 / 10.0, 1 - len(t) % 10 / 10.0] for t in texts]
+
+    def api_classify(self, parts, params, texts):
+        return [len(t) % 10 for t in texts]
+
+    def api_tag(self, parts, params, texts):
+        return [{'word': list(t), 'tag': ['x'] * len(t)} for t in texts]
+
+    def api_ner(self, parts, params, texts):
+        return [{'word': list(t), 'tag': ['x'] * len(t), 'entity': [[0, 1, 'x']] if t else []}
+                for t in texts]
+
+    def api_depparser(self, parts, params, texts):
+        return [{'word': list(t), 'tag': ['x'] * len(t), 'role': ['x'] * len(t),
+                 'head': [i + 1 for i in range(len(t) - 1)] + [-1]} for t in texts]
+
+    def api_suggest(self, parts, params, texts):
+        top_k = int(params.get('top_k', 10))
+        return [[1.0 / (i + 1), '%s%d' % (texts[0], i)] for i in range(top_k)]
+
+    def api_keywords(self, parts, params, texts):
+        top_k = int(params.get('top_k', 100))
+        return [[1.0 / (i + 1), c] for i, c in enumerate(texts[0][:top_k])]
+
+    def api_time(self, parts, params, texts):
+        return {'pattern': params['pattern'], 'basetime': params.get('basetime')}
+
+    def api_summary(self, parts, params, texts):
+        return texts[0]['content'][:10]
+
+    def _task(self, parts, texts):
+        action, task_id = parts
+        tasks = self.server.tasks
+        if action == 'push':
+            tasks.setdefault(task_id, []).extend(texts)
+            return True
+        if task_id not in tasks:
+            return None
+        if action == 'status':
+            return {'status': self.server.task_status}
+        if action == 'clear':
+            del tasks[task_id]
+            return True
+        groups = {}
+        for doc in tasks[task_id]:
+            groups.setdefault(doc['text'], []).append(doc['_id'])
+        return [ids for ids in groups.values() if len(ids) > 1]
+
+    def api_cluster(self, parts, params, texts):
+        groups = self._task(parts, texts)
+        if parts[0] != 'result':
+            return groups if groups is not None else {'status': 'NOT FOUND'}
+        return [{'_id': ids[0], 'list': ids, 'num': len(ids)} for ids in groups]
+
+    def api_comments(self, parts, params, texts):
+        groups = self._task(parts, texts)
+        if parts[0] != 'result':
+            return groups if groups is not None else {'status': 'NOT FOUND'}
+        docs = dict((doc['_id'], doc['text']) for doc in self.server.tasks[parts[1]])
+        return [{'_id': idx, 'opinion': docs[ids[0]][:4], 'num': len(ids),
+                 'list': [[docs[_id][:4], _id] for _id in ids]}
+                for idx, ids in enumerate(groups)]
+
+
+class FakeBosonNLPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FakeBosonNLPHandler)
+        self.url = 'http://127.0.0.1:%d' % self.server_address[1]
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = []
+        self.tasks = {}
+        self.task_status = 'DONE'
+        # Sleep this long before answering, for the next `delay_times` requests or forever.
+        self.delay = 0
+        self.delay_times = None
+        # Answer with this status code, for the next `fail_times` requests or forever.
+        self.fail_with = None
+        self.fail_times = None
+        # Answer requests with these tokens with 429, as if their quota was used up.
+        self.exhausted_tokens = set()
+
+
+@pytest.fixture(scope='module')
+def _fake_server():
+    server = FakeBosonNLPServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_server(_fake_server):
+    _fake_server.reset()
+    return _fake_server
+
+
+@pytest.fixture
+def fake_nlp(fake_server):
+    return BosonNLP('fake token', bosonnlp_url=fake_server.url)
+
+
+def test_fake_server_tag(fake_nlp):
+    assert fake_nlp.tag(['今天天气好']) == \
+        [{'word': ['今', '天', '天', '气', '好'], 'tag': ['x'] * 5}]
+
+
+def test_thread_safe_client_uses_per_thread_sessions(fake_server):
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, thread_safe=True)
+    sessions = []
+
+    def worker():
+        sessions.append(nlp.session)
+        sessions.append(nlp.session)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+
+    assert sessions[0] is sessions[1]
+    assert sessions[0] is not nlp.session
+    assert sessions[0].adapters is nlp.session.adapters
+    assert sessions[0].headers['X-Token'] == 'fake token'
+
+
+def test_pool_threads_get_their_own_sessions(fake_nlp):
+    sessions = []
+    real_suggest = fake_nlp.suggest
+
+    def suggest(word, top_k=None):
+        sessions.append((threading.current_thread().name, fake_nlp.session))
+        return real_suggest(word, top_k)
+    fake_nlp.suggest = suggest
+
+    fake_nlp.suggest_many(['今天', '天气', '好', '世界', '美好'], workers=3)
+    per_thread = dict((name, set(id(session) for n, session in sessions if n == name)) for name, _ in sessions)
+    assert all(len(ids) == 1 for ids in per_thread.values())
+    assert len(set(id(session) for _, session in sessions)) == len(per_thread)
+    assert all(session is not fake_nlp.session for _, session in sessions)
+
+
+def test_thread_safe_client_clones_session_subclass_and_cookies(fake_server):
+    import requests
+
+    class CustomSession(requests.Session):
+        pass
+
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, thread_safe=True)
+    session = CustomSession()
+    session.headers.update(nlp.session.headers)
+    session.cookies.set('sid', 'abc')
+    nlp.session = session
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(nlp.session))
+    thread.start()
+    thread.join()
+
+    assert type(sessions[0]) is CustomSession and sessions[0] is not session
+    assert sessions[0].cookies.get('sid') == 'abc'
+    sessions[0].cookies.set('sid', 'changed')
+    assert session.cookies.get('sid') == 'abc'
+
+
+def test_thread_safe_client_under_concurrency(fake_server):
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, thread_safe=True)
+    errors = []
+    sessions = []
+
+    def worker(n):
+        try:
+            for i in range(20):
+                text = '线程%d请求%d' % (n, i)
+                assert nlp.tag(text)[0]['word'] == list(text)
+            sessions.append(nlp.session)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(fake_server.requests) == 16 * 20
+    assert len(set(id(session) for session in sessions)) == 16
+
+
+def test_bulk_run_preserves_order(fake_server):
+    from bosonnlp import bulk
+
+    texts = ['文本%d' % i for i in range(25)]
+    results = bulk.run('tag', iter(texts), 'fake token', processes=2, chunk_size=3,
+                       nlp_options={'bosonnlp_url': fake_server.url})
+    assert [result['word'] for result in results] == [list(text) for text in texts]
+    assert len(fake_server.requests) == 9
+
+
+def test_bulk_run_rejects_non_batch_endpoint():
+    from bosonnlp import bulk
+
+    pytest.raises(ValueError, lambda: bulk.run('summary', [], 'fake token'))
+
+
+def test_dedup_sends_each_distinct_text_once(fake_nlp, fake_server):
+    texts = ['今天天气好', '转发', '今天天气好', '美好的世界', '转发', '转发']
+    assert fake_nlp.sentiment(texts, dedup=True) == fake_nlp.sentiment(texts)
+    assert fake_server.requests[0]['data'] == ['今天天气好', '转发', '美好的世界']
+    assert fake_server.requests[1]['data'] == texts
+
+    result = fake_nlp.tag(texts, dedup=True)
+    assert [r['word'] for r in result] == [list(text) for text in texts]
+
+
+def test_cluster_collapses_near_duplicates(fake_nlp, fake_server):
+    spam = '这家店的菜真的太难吃了，服务员态度也很差，再也不来了'
+    input = [(1, spam), (2, '今天天气好'), (3, spam + '！'), (4, '美好的世界'),
+             (5, '今天天气好'), (6, spam), (7, '美好的世界')]
+    result = fake_nlp.cluster(input, simhash_distance=3)
+    pushed = [doc['_id'] for doc in fake_server.requests[0]['data']]
+    assert pushed == [1, 2, 4]
+    assert sorted((c['_id'], c['list'], c['num']) for c in result) == \
+        [(1, [1, 3, 6], 3), (2, [2, 5], 2), (4, [4, 7], 2)]
+
+
+def test_comments_expands_collapsed_ids(fake_nlp, fake_server):
+    comments = fake_nlp.create_comments_task(simhash_distance=0)
+    comments.push([(1, '今天天气好'), (2, '美好的世界')])
+    comments.push([(3, '美好的世界'), (4, '美好的世界')])
+    # Pretend the server also holds a document pushed by another client.
+    fake_server.tasks[comments.task_id].append({'_id': 5, 'text': '美好的世界'})
+    result = comments.result()
+    assert result == [{'_id': 0, 'opinion': '美好的世', 'num': 4,
+                       'list': [['美好的世', 2], ['美好的世', 3], ['美好的世', 4], ['美好的世', 5]]}]
+    assert len(comments._contents) == 4
+
+
+def test_batches_are_cut_by_size_and_bytes(fake_server):
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, max_batch_bytes=1024)
+    texts = ['短评'] * 150 + ['长文' * 300] + ['短评'] * 10
+    assert nlp.classify(texts) == [len(text) % 10 for text in texts]
+    assert [len(r['data']) for r in fake_server.requests] == [100, 50, 1, 10]
+
+    fake_server.reset()
+    nlp.create_cluster_task([{'_id': i, 'text': '今天天气好'} for i in range(40)])
+    assert [len(r['data']) for r in fake_server.requests] == [26, 14]
+    assert all(len(r['body']) <= 1024 for r in fake_server.requests)
+
+
+def test_long_documents_are_split_and_merged(fake_nlp, fake_server):
+    text = '今天天气好。我们去公园吧！好的'
+    assert fake_nlp.ner([text, '短句'], max_length=7) == \
+        [{'word': list(text), 'tag': ['x'] * len(text),
+          'entity': [[0, 1, 'x'], [6, 7, 'x'], [13, 14, 'x']]},
+         {'word': ['短', '句'], 'tag': ['x', 'x'], 'entity': [[0, 1, 'x']]}]
+    assert fake_server.requests[0]['data'] == ['今天天气好。', '我们去公园吧！', '好的', '短句']
+
+    heads = fake_nlp.depparser(text, max_length=7)[0]['head']
+    assert heads == [1, 2, 3, 4, 5, -1, 7, 8, 9, 10, 11, 12, -1, 14, -1]
+
+
+def test_long_document_sentiment_weighting(fake_nlp):
+    text = '好。' + '天气不错'
+    assert fake_nlp.sentiment(text, max_length=3, weighting='uniform')[0] == pytest.approx([0.2, 0.8])
+    result = fake_nlp.sentiment(text, max_length=3)
+    assert result[0][0] == pytest.approx((0.2 * 2 + 0.3 * 3 + 0.1 * 1) / 6)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='lazy imports need module __getattr__')
+def test_import_is_lazy():
+    code = ('import sys, bosonnlp; '
+            'print(bosonnlp.__VERSION__); '
+            'assert "requests" not in sys.modules and "bosonnlp.client" not in sys.modules; '
+            'from bosonnlp import BosonNLP; '
+            'assert "bosonnlp.client" in sys.modules; '
+            'assert bosonnlp.exceptions.HTTPError is bosonnlp.HTTPError; '
+            'assert bosonnlp.registry.TaskRegistry')
+    output = subprocess.check_output([sys.executable, '-X', 'importtime', '-c', code],
+                                     stderr=subprocess.STDOUT).decode('utf-8')
+    # -X importtime lines: "import time: self [us] | cumulative | package"
+    cost = [int(line.split('|')[1]) for line in output.splitlines()
+            if line.startswith('import time:') and line.split('|')[-1].strip() == 'bosonnlp']
+    assert cost[0] < 50 * 1000
+
+
+def test_convert_time_batch(fake_nlp, fake_server):
+    patterns = ['今天', '昨天下午', '今天', '出错', '今天']
+    real_convert_time = fake_nlp.convert_time
+
+    def convert_time(content, basetime=None):
+        if content == '出错':
+            raise HTTPError('HTTPError: 400 bad pattern')
+        return real_convert_time(content, basetime)
+    fake_nlp.convert_time = convert_time
+
+    result = fake_nlp.convert_time_batch(patterns, basetime=1408674823, workers=3)
+    assert [r['pattern'] for r in result if not isinstance(r, Exception)] == ['今天', '昨天下午', '今天', '今天']
+    assert isinstance(result[3], HTTPError)
+    assert result[0] is result[2]
+    assert len(fake_server.requests) == 2
+    assert set(r['params']['basetime'] for r in fake_server.requests) == {'1408674823'}
+
+
+def test_summary_many_streams_and_caches(fake_nlp, fake_server):
+    articles = (('标题%d' % (i % 3), '第%d篇新闻的正文内容' % (i % 3)) for i in range(9))
+    results = fake_nlp.summary_many(articles, workers=2)
+    assert next(results) == '第0篇新闻的正文内容'
+    assert list(results) == ['第%d篇新闻的正文内容' % (i % 3) for i in range(1, 9)]
+    assert len(fake_server.requests) <= 3 + 2
+    assert len(fake_nlp._summary_cache) == 3
+
+    fake_server.fail_with = 500
+    assert list(fake_nlp.summary_many([('标题0', '第0篇新闻的正文内容')])) == ['第0篇新闻的正文内容']
+    assert isinstance(list(fake_nlp.summary_many([('', '新内容')]))[0], HTTPError)
+
+
+def test_suggest_many_reuses_larger_top_k(fake_nlp, fake_server):
+    assert fake_nlp.suggest_many(['北京', '上海', '北京'], top_k=5) == \
+        [fake_nlp.suggest('北京', top_k=5), fake_nlp.suggest('上海', top_k=5),
+         fake_nlp.suggest('北京', top_k=5)]
+    fake_server.reset()
+    assert fake_nlp.suggest_many(['北京'], top_k=2) == [[[1.0, '北京0'], [0.5, '北京1']]]
+    assert fake_server.requests == []
+    assert len(fake_nlp.suggest_many(['北京'], top_k=8)[0]) == 8
+    assert fake_server.requests[0]['params'] == {'top_k': '8'}
+
+
+def test_extract_keywords_many_cache_expires(fake_server):
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, cache_ttl=0.1)
+    assert nlp.extract_keywords_many(['病毒式', '蔓延'], top_k=2) == \
+        [[[1.0, '病'], [0.5, '毒']], [[1.0, '蔓'], [0.5, '延']]]
+    assert nlp.extract_keywords_many(['蔓延'], top_k=10) == [[[1.0, '蔓'], [0.5, '延']]]
+    assert len(fake_server.requests) == 3
+    # Fewer results than top_k means the cached result is complete.
+    assert nlp.extract_keywords_many(['蔓延'], top_k=20) == [[[1.0, '蔓'], [0.5, '延']]]
+    assert nlp.extract_keywords_many(['蔓延'], top_k=1) == [[[1.0, '蔓']]]
+    assert len(fake_server.requests) == 3
+    time.sleep(0.2)
+    nlp.extract_keywords_many(['蔓延'], top_k=1)
+    assert len(fake_server.requests) == 4
+
+
+def test_analyze_encodes_each_batch_once(fake_server):
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, max_batch_size=2)
+    texts = ['今天天气好', '美好的世界', '再也不来了']
+    records = nlp.analyze(texts, tasks=['tag', 'classify', 'keywords'])
+    assert records == [{'tag': nlp.tag(text)[0], 'classify': nlp.classify(text)[0],
+                        'keywords': nlp.extract_keywords(text)} for text in texts]
+    batch_requests = [r for r in fake_server.requests[:7] if r['path'] != '/keywords/analysis']
+    assert len(batch_requests) == 4
+    assert set(r['body'] for r in batch_requests) == \
+        set([json.dumps(texts[:2], ensure_ascii=False).replace(', ', ',').encode('utf-8'),
+             json.dumps(texts[2:], ensure_ascii=False).encode('utf-8')])
+    pytest.raises(ValueError, lambda: nlp.analyze(texts, tasks=['summary']))
+
+
+def test_batched_calls_write_each_batch_to_sink(fake_server):
+    from bosonnlp.sinks import CallbackSink
+
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, max_batch_size=2)
+    texts = ['今天', '天气', '好', '天气']
+    seen = []
+    sink = CallbackSink(lambda index, result: seen.append((index, result, len(fake_server.requests))))
+    assert nlp.classify(texts, sink=sink) == 4
+    # Each batch is written before the next one is sent.
+    assert seen == [(0, 2, 1), (1, 2, 1), (2, 1, 2), (3, 2, 2)]
+
+    del seen[:]
+    assert nlp.tag(texts, dedup=True, sink=sink) == 4
+    assert [(index, result['word']) for index, result, _ in seen] == list(enumerate(list(text) for text in texts))
+
+
+NER_RESULTS = [
+    {'entity': [[0, 2, 'product_name'], [2, 3, 'job_title'], [3, 4, 'person_name']],
+     'tag': ['ns', 'n', 'n', 'nr'],
+     'word': ['成都', '商报', '记者', '姚永忠']},
+    {'entity': [[0, 2, 'product_name'], [3, 4, 'time']],
+     'tag': ['nz', 'nx', 'nl', 't', 'ad', 'v'],
+     'word': ['微软', 'XP', '操作系统', '今日', '正式', '退休']},
+]
+
+
+def test_columnar_to_numpy():
+    pytest.importorskip('numpy')
+    from bosonnlp.columnar import to_numpy
+
+    arrays = to_numpy(NER_RESULTS)
+    assert arrays['word_offsets'].tolist() == [0, 4, 10]
+    assert arrays['words'].tolist()[3:5] == ['姚永忠', '微软']
+    assert [arrays['tags'][i] for i in arrays['tag_ids']] == NER_RESULTS[0]['tag'] + NER_RESULTS[1]['tag']
+    assert arrays['entity_offsets'].tolist() == [0, 3, 5]
+    assert arrays['entity_spans'].tolist() == [[0, 2], [2, 3], [3, 4], [4, 6], [7, 8]]
+    assert [arrays['entity_types'][i] for i in arrays['entity_type_ids']] == \
+        ['product_name', 'job_title', 'person_name', 'product_name', 'time']
+
+    heads = to_numpy([{'word': ['今天', '天气', '好'], 'head': [2, 2, -1]},
+                      {'word': ['美好', '的', '世界'], 'head': [1, 2, -1]}])['heads']
+    assert heads.tolist() == [2, 2, -1, 4, 5, -1]
+
+
+def test_columnar_to_arrow():
+    pytest.importorskip('pyarrow')
+    from bosonnlp.columnar import to_arrow
+
+    table = to_arrow(NER_RESULTS)
+    assert table.column_names == ['entity_end', 'entity_start', 'entity_type', 'tag', 'word']
+    rows = table.to_pylist()
+    assert rows[1]['word'] == NER_RESULTS[1]['word']
+    assert rows[1]['tag'] == NER_RESULTS[1]['tag']
+    assert [list(e) for e in zip(rows[0]['entity_start'], rows[0]['entity_end'], rows[0]['entity_type'])] == \
+        NER_RESULTS[0]['entity']
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_bulk_run_writes_to_jsonl_sink(fake_server, tmpdir, ordered):
+    from bosonnlp import bulk
+    from bosonnlp.sinks import JSONLSink
+
+    texts = ['文本%d' % i for i in range(25)]
+    path = str(tmpdir.join('tags.jsonl'))
+    with JSONLSink(path, with_index=True) as sink:
+        count = bulk.run('tag', texts, 'fake token', processes=2, chunk_size=4, ordered=ordered, sink=sink,
+                         nlp_options={'bosonnlp_url': fake_server.url})
+    assert count == 25
+    with open(path, 'rb') as f:
+        records = [json.loads(line.decode('utf-8')) for line in f]
+    if ordered:
+        assert [record['index'] for record in records] == list(range(25))
+    assert sorted((record['index'], record['result']['word']) for record in records) == \
+        [(i, list(text)) for i, text in enumerate(texts)]
+
+
+def test_bulk_run_unordered_yields_indices(fake_server):
+    from bosonnlp import bulk
+
+    texts = ['文本%d' % i for i in range(10)]
+    results = bulk.run('classify', texts, 'fake token', processes=2, chunk_size=3, ordered=False,
+                       nlp_options={'bosonnlp_url': fake_server.url})
+    assert sorted(results) == [(i, len(text) % 10) for i, text in enumerate(texts)]
+
+
+def test_parquet_sink(tmpdir):
+    pq = pytest.importorskip('pyarrow.parquet')
+    from bosonnlp.sinks import ParquetSink, CallbackSink
+
+    path = str(tmpdir.join('tags.parquet'))
+    with ParquetSink(path, batch_size=2) as sink:
+        for i, text in enumerate(['今天', '天气', '好']):
+            sink.write(i, {'word': list(text), 'tag': ['x'] * len(text)})
+    assert pq.ParquetFile(path).num_row_groups == 2
+    rows = pq.read_table(path).to_pylist()
+    assert rows[2] == {'index': 2, 'result': {'word': ['好'], 'tag': ['x']}}
+
+    seen = []
+    with CallbackSink(lambda index, result: seen.append((index, result))) as sink:
+        sink.write(0, [5])
+    assert seen == [(0, [5])]
+
+
+def test_pipeline_from_queue(fake_server):
+    from bosonnlp.pipeline import Pipeline
+    try:
+        import queue
+    except ImportError:
+        import Queue as queue
+
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, thread_safe=True)
+    source = queue.Queue()
+    texts = ['文本%d' % i for i in range(23)]
+    for text in texts:
+        source.put(text)
+    source.put(None)
+
+    pipeline = Pipeline(nlp, 'classify', source, batch_size=5, max_in_flight=2, rate_limit=1000)
+    assert list(pipeline) == [len(text) % 10 for text in texts]
+    assert pipeline.stats() == {'queue_depth': 0, 'in_flight': 0, 'processed': 23, 'retries': 0,
+                                'source_depth': 0}
+
+
+def test_pipeline_reports_batches_waiting_for_capacity(fake_server):
+    from bosonnlp.pipeline import Pipeline
+
+    fake_server.delay = 0.3
+    texts = ['今天', '天气', '好', '世界', '美好']
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, thread_safe=True)
+    for read_ahead, queued in [(2, 2), (0, 0)]:
+        pipeline = Pipeline(nlp, 'classify', iter(texts), batch_size=1, max_in_flight=1, read_ahead=read_ahead)
+        results = []
+        thread = threading.Thread(target=lambda: results.extend(pipeline))
+        thread.start()
+        time.sleep(0.15)
+        stats = pipeline.stats()
+        thread.join()
+        assert (stats['queue_depth'], stats['in_flight']) == (queued, 1)
+        assert results == [len(text) % 10 for text in texts]
+
+
+def test_pipeline_retries_and_writes_to_sink(fake_server):
+    from bosonnlp.pipeline import Pipeline
+    from bosonnlp.sinks import CallbackSink
+
+    fake_server.fail_with = 503
+    fake_server.fail_times = 2
+    seen = []
+    pipeline = Pipeline(BosonNLP('fake token', bosonnlp_url=fake_server.url), 'tag', iter(['今天', '天气']),
+                        batch_size=1, max_in_flight=1, backoff=0.01,
+                        sink=CallbackSink(lambda index, result: seen.append((index, result['word']))))
+    assert pipeline.run() == 2
+    assert seen == [(0, ['今', '天']), (1, ['天', '气'])]
+    assert pipeline.stats()['retries'] == 2
+
+    pipeline = Pipeline(BosonNLP('fake token', bosonnlp_url=fake_server.url), 'tag', ['好'])
+    pytest.raises(ValueError, pipeline.run)
+    seen = []
+    assert pipeline.run(CallbackSink(lambda index, result: seen.append(result['word']))) == 1
+    assert seen == [['好']]
+
+    fake_server.fail_times = None
+    pipeline = Pipeline(BosonNLP('fake token', bosonnlp_url=fake_server.url), 'tag', ['今天'],
+                        retries=1, backoff=0.01)
+    pytest.raises(HTTPError, lambda: list(pipeline))
+    fake_server.fail_with = 400
+    pipeline = Pipeline(BosonNLP('fake token', bosonnlp_url=fake_server.url), 'tag', ['今天'], backoff=0.01)
+    pytest.raises(HTTPError, lambda: list(pipeline))
+    assert pipeline.stats()['retries'] == 0
+
+
+def test_pipeline_respects_deadline(fake_server):
+    import requests
+    from bosonnlp.pipeline import Pipeline
+
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url)
+    fake_server.delay = 1
+    pipeline = Pipeline(nlp, 'tag', ['今天', '天气'], batch_size=1, max_in_flight=2, backoff=0.01)
+    start = time.time()
+    with nlp.deadline(0.2):
+        pytest.raises((requests.Timeout, TimeoutError), lambda: list(pipeline))
+    assert time.time() - start < 0.6
+
+    fake_server.delay = 0
+    fake_server.fail_with = 503
+    pipeline = Pipeline(nlp, 'tag', ['今天'], backoff=1)
+    start = time.time()
+    with nlp.deadline(0.5):
+        pytest.raises(HTTPError, lambda: list(pipeline))
+    # No retry is started that could not finish before the deadline.
+    assert time.time() - start < 0.4
+    assert pipeline.stats()['retries'] == 0
+
+
+def test_circuit_breaker_opens_and_recovers(fake_server):
+    from bosonnlp import CircuitBreaker, CircuitOpenError
+
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, circuit_breaker=breaker)
+    fake_server.fail_with = 503
+    for _ in range(2):
+        pytest.raises(HTTPError, lambda: nlp.ner('今天'))
+    assert breaker.state('/ner/analysis') == 'open'
+    excinfo = pytest.raises(CircuitOpenError, lambda: nlp.ner('今天'))
+    assert excinfo.value.endpoint == '/ner/analysis'
+    assert len(fake_server.requests) == 2
+    # Other endpoints are not affected.
+    pytest.raises(HTTPError, lambda: nlp.tag('今天'))
+
+    fake_server.fail_with = None
+    time.sleep(0.25)
+    assert breaker.state('/ner/analysis') == 'half_open'
+    assert nlp.ner('今天')[0]['word'] == ['今', '天']
+    assert breaker.state('/ner/analysis') == 'closed'
+
+
+def test_circuit_breaker_records_any_trial_error(fake_server):
+    from bosonnlp import CircuitBreaker
+
+    def broken_hook(r, *args, **kwargs):
+        raise LookupError
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, circuit_breaker=breaker)
+    fake_server.fail_with = 503
+    fake_server.fail_times = 1
+    pytest.raises(HTTPError, lambda: nlp.ner('今天'))
+    time.sleep(0.15)
+    nlp.session.hooks['response'].append(broken_hook)
+    pytest.raises(LookupError, lambda: nlp.ner('今天'))
+    assert breaker.state('/ner/analysis') == 'open'
+
+    nlp.session.hooks['response'].remove(broken_hook)
+    time.sleep(0.15)
+    assert nlp.ner('今天')
+    assert breaker.state('/ner/analysis') == 'closed'
+
+
+def test_circuit_breaker_counts_slow_calls(fake_server):
+    from bosonnlp import CircuitBreaker, CircuitOpenError
+
+    breaker = CircuitBreaker(failure_threshold=1, slow_call_duration=0.05)
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, circuit_breaker=breaker)
+    fake_server.delay = 0.1
+    cluster = nlp.create_cluster_task(['今天天气好'])
+    pytest.raises(CircuitOpenError, lambda: cluster.push(['今天天气好']))
+    assert breaker.state('/cluster/push/' + cluster.task_id) == 'open'
+
+
+def test_hedged_request_takes_first_answer(fake_server):
+    from bosonnlp import Hedger
+
+    hedger = Hedger(max_ratio=0.05, min_samples=5)
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, hedger=hedger, thread_safe=True)
+    for _ in range(20):
+        nlp.ner('今天')
+    fake_server.delay = 1
+    fake_server.delay_times = 1
+    start = time.time()
+    assert nlp.ner('今天')[0]['word'] == ['今', '天']
+    assert time.time() - start < 0.5
+    assert hedger.stats() == {'requests': 21, 'hedged': 1, 'hedge_wins': 1}
+
+    # The hedge budget is spent, so the next slow request is just waited for.
+    fake_server.delay = 0.3
+    fake_server.delay_times = 1
+    start = time.time()
+    nlp.ner('今天')
+    assert time.time() - start >= 0.3
+    assert hedger.stats()['hedged'] == 1
+    assert len(fake_server.requests) == 23
+
+
+def test_hedging_reuses_threads_and_sessions(fake_server, monkeypatch):
+    from bosonnlp import Hedger, client
+
+    clones = []
+    clone_session = client._clone_session
+    monkeypatch.setattr(client, '_clone_session', lambda session: clones.append(1) or clone_session(session))
+    def workers():
+        return set(thread for thread in threading.enumerate() if thread.name == 'bosonnlp-worker')
+
+    existing = workers()
+    monkeypatch.setattr(client, '_attempt_pool', client._WorkerPool(idle_timeout=0.2))
+    hedger = Hedger(min_samples=5)
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, hedger=hedger)
+    for _ in range(100):
+        nlp.ner('今天')
+    assert 1 <= len(workers() - existing) <= 3
+    assert len(clones) == len(workers() - existing)
+
+    # Short-lived clients share the threads, and idle threads exit.
+    for _ in range(20):
+        BosonNLP('fake token', bosonnlp_url=fake_server.url, hedger=hedger).ner('今天')
+    assert 1 <= len(workers() - existing) <= 3
+    time.sleep(0.5)
+    assert workers() - existing == set()
+
+
+def test_deadline_caps_request_timeouts(fake_server):
+    import requests
+
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, timeout=(5, 60))
+    fake_server.delay = 0.5
+    start = time.time()
+    with nlp.deadline(0.2):
+        pytest.raises(requests.Timeout, lambda: nlp.tag('今天'))
+        pytest.raises(TimeoutError, lambda: nlp.tag('今天'))
+        # The deadline also covers requests made from worker threads.
+        assert all(isinstance(r, TimeoutError) for r in nlp.convert_time_batch(['今天', '明天']))
+    assert time.time() - start < 0.5
+    fake_server.delay = 0
+    assert nlp.tag('今天')
+
+
+def test_wait_until_complete_respects_deadline(fake_nlp, fake_server):
+    fake_server.task_status = 'RUNNING'
+    start = time.time()
+    with fake_nlp.deadline(0.3):
+        with pytest.raises(TimeoutError) as excinfo:
+            with fake_nlp.create_cluster_task(['今天天气好']) as cluster:
+                cluster.wait_until_complete(timeout=60)
+        assert '/clear/' not in str(excinfo.value)
+        # The task is cleared on exit although the deadline has passed.
+        assert fake_server.tasks == {}
+        pytest.raises(TimeoutError, lambda: fake_nlp.cluster(['今天天气好']))
+        assert fake_server.tasks == {}
+    assert time.time() - start < 0.6
+
+
+def test_backends_weighted_round_robin(fake_server):
+    nlp = BosonNLP('token a', bosonnlp_url=fake_server.url, backends=[(fake_server.url, 'token b', 2)])
+    for _ in range(6):
+        nlp.sentiment('今天天气好')
+    tokens = [request['token'] for request in fake_server.requests]
+    assert tokens.count('token a') == 2
+    assert tokens.count('token b') == 4
+
+
+def test_backends_fail_over(fake_server):
+    # Nothing listens on the discard port.
+    nlp = BosonNLP('token a', bosonnlp_url='http://127.0.0.1:9', backends=[(fake_server.url, 'token b')],
+                   balancing='least_outstanding')
+    assert len(nlp.tag(['今天', '明天', '后天'])) == 3
+    assert nlp.sentiment('今天天气好')
+    assert [request['token'] for request in fake_server.requests] == ['token b', 'token b']
+
+    fake_server.reset()
+    nlp = BosonNLP('token a', bosonnlp_url=fake_server.url, backends=[(fake_server.url, 'token b')])
+    fake_server.exhausted_tokens.add('token a')
+    for _ in range(3):
+        nlp.sentiment('今天天气好')
+    # The exhausted token is only tried once.
+    assert [request['token'] for request in fake_server.requests] == ['token a'] + ['token b'] * 3
+
+    fake_server.exhausted_tokens.add('token b')
+    with pytest.raises(HTTPError) as excinfo:
+        nlp.sentiment('今天天气好')
+    assert excinfo.value.response.status_code == 429
+
+
+def test_backends_sharing_a_url_have_separate_circuits(fake_server):
+    from bosonnlp import CircuitBreaker
+
+    breaker = CircuitBreaker(failure_threshold=2)
+    nlp = BosonNLP('token a', bosonnlp_url=fake_server.url, circuit_breaker=breaker,
+                   backends=[(fake_server.url, 'token b'), (fake_server.url, 'token c')])
+    fake_server.exhausted_tokens.update(['token a', 'token b'])
+    for _ in range(5):
+        assert nlp.sentiment('今天天气好')
+    assert [request['token'] for request in fake_server.requests] == ['token a', 'token b'] + ['token c'] * 5
+    assert [breaker.state('/sentiment/analysis@%d' % i) for i in range(3)] == ['closed'] * 3
+
+    fake_server.reset()
+    fake_server.fail_with = 503
+    for _ in range(2):
+        pytest.raises(HTTPError, lambda: nlp.sentiment('今天天气好'))
+    assert [breaker.state('/sentiment/analysis@%d' % i) for i in range(3)] == ['open'] * 3
+
+
+def test_backends_pin_tasks(fake_server):
+    nlp = BosonNLP('token a', bosonnlp_url=fake_server.url, backends=[(fake_server.url, 'token b')])
+    cluster = nlp.create_cluster_task(['今天天气好', '今天天气不错'])
+    cluster.analysis()
+    cluster.wait_until_complete()
+    cluster.result()
+    cluster.clear()
+    assert len(set(request['token'] for request in fake_server.requests)) == 1
+    assert nlp._task_backends == {}
+
+
+def test_task_context_manager_clears(fake_nlp, fake_server):
+    with pytest.raises(ValueError):
+        with fake_nlp.create_comments_task(['今天天气好', '今天天气好']) as comments:
+            comments.analysis()
+            raise ValueError
+    assert fake_server.tasks == {}
+    assert fake_nlp.cluster(['今天天气好', '今天天气好'])
+    assert fake_server.tasks == {}
+
+
+def test_task_registry_sweeps_abandoned_tasks(fake_server, tmpdir):
+    from bosonnlp.registry import TaskRegistry
+
+    path = str(tmpdir.join('tasks.json'))
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, task_registry=TaskRegistry(path))
+    with nlp.create_cluster_task(['今天天气好']):
+        pass
+    abandoned = [nlp.create_cluster_task(['今天天气好']), nlp.create_comments_task(['今天天气好'])]
+    assert len(fake_server.tasks) == 2
+
+    # As if the process crashed and was started again.
+    registry = TaskRegistry(path)
+    assert sorted(task['kind'] for task in registry.tasks()) == ['cluster', 'comments']
+    assert registry.sweep(nlp) == []
+    assert sorted(registry.sweep(nlp, older_than=0)) == sorted(task.task_id for task in abandoned)
+    assert fake_server.tasks == {}
+    assert TaskRegistry(path).tasks() == []
+
+
+def test_task_registry_clears_tasks_on_their_backend(fake_server, tmpdir):
+    from bosonnlp.registry import TaskRegistry
+
+    path = str(tmpdir.join('tasks.json'))
+    backends = [(fake_server.url, 'token b')]
+    nlp = BosonNLP('token a', bosonnlp_url=fake_server.url, backends=backends, task_registry=TaskRegistry(path))
+    tasks = [nlp.create_cluster_task(['今天天气好']) for _ in range(2)]
+    assert sorted(task['backend'] for task in TaskRegistry(path).tasks()) == [0, 1]
+
+    nlp = BosonNLP('token a', bosonnlp_url=fake_server.url, backends=backends)
+    assert len(TaskRegistry(path).sweep(nlp, older_than=0)) == 2
+    tokens = {}
+    for request in fake_server.requests:
+        tokens.setdefault(request['path'].split('/')[3], []).append(request['token'])
+    assert sorted(tokens[task.task_id][0] for task in tasks) == ['token a', 'token b']
+    assert all(len(set(tokens[task.task_id])) == 1 for task in tasks)
+
+
+def test_incremental_update_diffs_results(fake_nlp, fake_server):
+    with fake_nlp.create_comments_task() as comments:
+        result, diff = comments.update([('a1', '今天天气好'), ('a2', '今天天气好'), ('b1', '明天下雨了')])
+        assert len(result) == 1
+        assert diff == {'new': result, 'grown': [], 'removed': [], 'moved': {}}
+
+        result, diff = comments.update([('a3', '今天天气好'), ('b2', '明天下雨了'),
+                                        ('c1', '后天刮大风'), ('c2', '后天刮大风')])
+        # Only the new documents are pushed.
+        assert sum(len(r['data']) for r in fake_server.requests if '/push/' in r['path']) == 7
+        assert [opinion['num'] for opinion in diff['grown']] == [3]
+        assert sorted(opinion['opinion'] for opinion in diff['new']) == ['后天刮大', '明天下雨']
+        assert diff['removed'] == [] and diff['moved'] == {}
+
+    cluster = fake_nlp.create_cluster_task()
+    previous = [{'_id': 'a', 'list': ['a', 'b', 'c'], 'num': 3}, {'_id': 'x', 'list': ['x', 'y'], 'num': 2}]
+    current = [{'_id': 'b', 'list': ['b', 'c', 'd'], 'num': 3}, {'_id': 'a', 'list': ['a', 'z'], 'num': 2}]
+    diff = cluster._diff(previous, current)
+    assert diff['new'] == [current[1]]
+    assert diff['grown'] == [current[0]]
+    assert diff['removed'] == [previous[1]]
+    assert diff['moved'] == {'a': ['a', 'a'], 'x': ['x', None], 'y': ['x', None]}
+    cluster.clear()
+
+
+@pytest.mark.parametrize('endpoint', ['cluster', 'comments'])
+def test_sharded_clustering_merges_shards(fake_nlp, fake_server, endpoint):
+    texts = ['今天天气好'] * 6 + ['明天下雨了'] * 6 + ['后天刮大风'] * 6 + ['点点楼头细雨']
+    result = getattr(fake_nlp, endpoint)(texts, shards=3)
+    analysed = set(r['path'].rsplit('/', 1)[1] for r in fake_server.requests if '/analysis/' in r['path'])
+    # Three shard tasks and one task to merge them.
+    assert len(analysed) == 4
+    assert [group['num'] for group in result] == [6, 6, 6]
+    if endpoint == 'cluster':
+        groups = [sorted(group['list']) for group in result]
+    else:
+        assert [group['_id'] for group in result] == [0, 1, 2]
+        groups = [sorted(_id for _, _id in group['list']) for group in result]
+    assert sorted(groups) == [list(range(0, 6)), list(range(6, 12)), list(range(12, 18))]
+    assert fake_server.tasks == {}
+
+
+@pytest.mark.parametrize('endpoint', ['cluster', 'comments'])
+def test_sharded_clustering_merges_documents_across_shards(fake_nlp, fake_server, endpoint):
+    # Striped over two shards, every duplicate lands in the other shard.
+    texts = ['今天天气好', '今天天气好', '明天下雨了', '明天下雨了', '点点楼头细雨']
+    result = getattr(fake_nlp, endpoint)(texts, shards=2)
+    if endpoint == 'cluster':
+        groups = [sorted(group['list']) for group in result]
+    else:
+        groups = [sorted(_id for _, _id in group['list']) for group in result]
+    assert sorted(groups) == [[0, 1], [2, 3]]
+    assert fake_server.tasks == {}
+
+
+def test_compact_ids(fake_nlp, fake_server):
+    ids = ['doc-%d-9e90c56e-f1bb-4605-b995' % i for i in range(5)]
+    texts = ['今天天气好', '今天天气好', '明天下雨了', '美好的世界', '明天下雨了']
+    with fake_nlp.create_cluster_task(list(zip(ids[:3], texts[:3])), compact_ids=True) as cluster:
+        cluster.push([{'_id': _id, 'text': text} for _id, text in zip(ids[3:], texts[3:])])
+        pushed = [doc['_id'] for r in fake_server.requests if '/push/' in r['path'] for doc in r['data']]
+        assert pushed == [0, 1, 2, 3, 4]
+        cluster.analysis()
+        cluster.wait_until_complete()
+        result = cluster.result()
+    assert sorted(map(sorted, (c['list'] for c in result))) == [[ids[0], ids[1]], [ids[2], ids[4]]]
+    assert set(c['_id'] for c in result) == set([ids[0], ids[2]])
+
+    # Combined with collapsing near-duplicates, only representatives get an integer _id.
+    fake_server.reset()
+    result = fake_nlp.cluster(list(zip(ids, texts)), simhash_distance=0, compact_ids=True)
+    pushed = [doc['_id'] for r in fake_server.requests if '/push/' in r['path'] for doc in r['data']]
+    assert pushed == [0, 1, 2]
+    assert sorted(c['list'] for c in result) == [[ids[0], ids[1]], [ids[2], ids[4]]]
+
+    fake_server.reset()
+    result = fake_nlp.comments(texts, compact_ids=True)
+    assert sorted(sorted(_id for _, _id in opinion['list']) for opinion in result) == [[0, 1], [2, 4]]
+
+
+def test_fields_projection(fake_nlp):
+    assert fake_nlp.ner(['今天', '天气好'], fields=['entity']) == [{'entity': [[0, 1, 'x']]}] * 2
+    assert fake_nlp.tag('今天', fields=('word',)) == [{'word': ['今', '天']}]
+    # Merging split documents still sees the words it needs.
+    result = fake_nlp.depparser(['今天天气好。明天下雨了。'], max_length=7, fields=['head'])
+    assert result == [{'head': [1, 2, 3, 4, 5, -1, 7, 8, 9, 10, 11, -1]}]
+
+
+def test_pre_encoded_payloads(fake_nlp, fake_server):
+    from bosonnlp import Payload
+    from bosonnlp.client import _gzip_compress
+
+    raw = json.dumps(['今天天气好', '美好的世界'], ensure_ascii=False).encode('utf-8')
+    expected = fake_nlp.classify(['今天天气好', '美好的世界'])
+    fake_server.reset()
+    assert fake_nlp.classify(bytearray(raw)) == expected
+    assert fake_nlp.classify(memoryview(raw)) == expected
+    assert fake_nlp.tag(Payload(_gzip_compress(raw), gzipped=True), fields=['word']) == [
+        {'word': list('今天天气好')}, {'word': list('美好的世界')}]
+    assert [r['body'] for r in fake_server.requests] == [raw] * 3
+    assert [r['content_encoding'] for r in fake_server.requests] == [None, None, 'gzip']
+
+    records = fake_nlp.analyze(Payload(raw), tasks=['classify', 'tag'])
+    assert [record['classify'] for record in records] == expected
+    pytest.raises(ValueError, lambda: fake_nlp.analyze(Payload(raw), tasks=['keywords']))
+
+
+def test_record_and_replay(fake_server, tmpdir):
+    from bosonnlp import replay
+
+    path = str(tmpdir.join('bosonnlp.jsonl'))
+    texts = ['今天天气好', '美好的世界'] * 60
+    nlp = BosonNLP('fake token', bosonnlp_url=fake_server.url, thread_safe=True)
+    with replay.record(nlp, path) as recording:
+        tags = nlp.tag(texts)
+        sentiments = nlp.sentiment(texts)
+        with nlp.create_cluster_task(list(enumerate(texts)), task_id='replaytask') as cluster:
+            fake_server.task_status = 'RUNNING'
+            pytest.raises(TimeoutError, lambda: cluster.wait_until_complete(0.1))
+            fake_server.task_status = 'DONE'
+            cluster.wait_until_complete()
+            clusters = cluster.result()
+    assert len(recording) == len(fake_server.requests)
+    # Recording stops on exit.
+    nlp.classify('今天天气好')
+    assert len(replay.Recording(path)) == len(fake_server.requests) - 1
+
+    fake_server.reset()
+    # Another token and an address nothing listens on.
+    nlp = BosonNLP('other token', bosonnlp_url='http://127.0.0.1:9', thread_safe=True)
+    with replay.replay(nlp, path):
+        assert nlp.tag(texts) == tags
+        assert nlp.sentiment(texts) == sentiments
+        with nlp.create_cluster_task(list(enumerate(texts)), task_id='replaytask') as cluster:
+            pytest.raises(TimeoutError, lambda: cluster.wait_until_complete(0.1))
+            cluster.wait_until_complete()
+            assert cluster.result() == clusters
+        pytest.raises(replay.RecordingNotFoundError, lambda: nlp.classify('今天天气好'))
+    assert fake_server.requests == []